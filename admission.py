@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+
+# Client address from an X-Forwarded-For header: the entry appended by the
+# outermost of `hops` trusted proxies. Entries further left are whatever the
+# client sent. None without the header or when it has fewer entries.
+def forwarded_client(header, hops=config.TRUSTED_PROXY_HOPS):
+    if not header or hops <= 0:
+        return None
+    entries = [entry.strip() for entry in header.split(",")]
+    if len(entries) < hops:
+        return None
+    return entries[-hops] or None
+
+
+# Token bucket refilled at rate tokens per second, holding at most burst
+class TokenBucket:
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    # Take one token; returns 0.0 when allowed, otherwise the seconds until
+    # the next token
+    def take(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+# One token bucket per client (session id or IP address). Only the most
+# recently seen max_clients are tracked; an evicted client starts again with
+# a full bucket. A rate of 0 disables the limit.
+class RateLimiter:
+    def __init__(
+        self,
+        per_minute=config.RATE_LIMIT_PER_MINUTE,
+        burst=config.RATE_LIMIT_BURST,
+        max_clients=config.RATE_LIMIT_MAX_CLIENTS,
+    ):
+        self.rate = per_minute / 60
+        self.burst = max(1, burst)
+        self.max_clients = max_clients
+
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self._counters = {"allowed": 0, "limited": 0}
+
+    # Seconds the client has to wait before its next question, 0.0 if it may
+    # ask now
+    def check(self, client):
+        if self.rate <= 0 or client is None:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst, now)
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(client)
+            retry_after = bucket.take(now)
+            self._counters["limited" if retry_after else "allowed"] += 1
+        return retry_after
+
+    def stats(self):
+        with self._lock:
+            return {
+                "per_minute": round(self.rate * 60, 3),
+                "burst": self.burst,
+                "clients": len(self._buckets),
+                **self._counters,
+            }
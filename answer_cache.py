@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import config
+from knowledge_base import normalize_question
+
+
+# Answer cache keyed on the normalized question, with a semantic fallback that
+# compares the query embedding against the embeddings of cached questions.
+# Entries expire after ttl_seconds and the least recently used entry is evicted
+# once max_entries is reached. The whole cache is dropped whenever the
+# fingerprint (knowledge base + system prompt) changes.
+class AnswerCache:
+    def __init__(
+        self,
+        max_entries=config.ANSWER_CACHE_SIZE,
+        ttl_seconds=config.ANSWER_CACHE_TTL_SECONDS,
+        similarity_threshold=config.ANSWER_CACHE_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.fingerprint = None
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = {
+            "lookups": 0,
+            "hits": 0,
+            "semantic_hits": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    # Drop every entry if the knowledge base or prompt changed
+    def check_fingerprint(self, fingerprint):
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                if self._entries:
+                    self._counters["invalidations"] += 1
+                self._entries.clear()
+                self.fingerprint = fingerprint
+
+    def _expire(self, now):
+        expired = [
+            key
+            for key, entry in self._entries.items()
+            if now - entry["created"] > self.ttl_seconds
+        ]
+        for key in expired:
+            del self._entries[key]
+        self._counters["expirations"] += len(expired)
+
+    # Exact lookup on the normalized question, no embedding needed
+    def get(self, question):
+        key = normalize_question(question)
+        with self._lock:
+            self._counters["lookups"] += 1
+            self._expire(time.monotonic())
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry["answer"]
+
+    # Nearest cached question by cosine similarity, above the threshold. Only
+    # called after get() missed, so it does not count as another lookup.
+    def get_similar(self, embedding):
+        query = _unit(embedding)
+        with self._lock:
+            self._expire(time.monotonic())
+            keys = [k for k, e in self._entries.items() if e["embedding"] is not None]
+            if keys:
+                matrix = np.stack([self._entries[k]["embedding"] for k in keys])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    self._entries.move_to_end(keys[best])
+                    self._counters["semantic_hits"] += 1
+                    return self._entries[keys[best]]["answer"]
+            return None
+
+    def put(self, question, answer, embedding=None):
+        key = normalize_question(question)
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "embedding": None if embedding is None else _unit(embedding),
+                "created": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, entries=len(self._entries))
+        hits = stats["hits"] + stats["semantic_hits"]
+        stats["misses"] = stats["lookups"] - hits
+        stats["hit_rate"] = round(hits / stats["lookups"], 3) if stats["lookups"] else 0.0
+        return stats
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
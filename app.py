@@ -1,24 +1,17 @@
 import streamlit as st
-from together import Together
-import chromadb
-import json
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-import os
+import hmac
+import html
+import time
+import uuid
 
-# Disable tokenizer parallelism warnings
-os.environ["TOKENIZERS_PARALLELISM"] = "false"
+import config
+from admission import forwarded_client
+from conversation import SUMMARY_ROLE
+from llm_service import LLMService
+from metrics import metrics
+from tenants import TenantRegistry, load_tenants
 
-# Default system prompt
-DEFAULT_SYSTEM_PROMPT = """I am Ravi, a Software Engineer with a Master's Degree in Computer Science specializing in Machine Learning. 
-My background includes:
-- Bachelor's in Electronics and Communication Engineering
-- Experience at Oracle and GW Law's Office of Instructional Technology
-- Expertise in Python, JavaScript, cloud technologies, and automation
-- Strong focus on building efficient developer tools and workflows
-
-and You are a digital version of me so try to Answer questions professionally while maintaining a helpful, knowledgeable tone. 
-When possible, provide structured responses with clear sections and bullet points.
-"""
+run_started = time.perf_counter()
 
 # Set page configuration
 st.set_page_config(page_title="How can I help you?", page_icon="🤖", layout="centered")
@@ -87,239 +80,165 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# Hosted personas around the shared embedding model and LLM service. A
+# persona's engine loads in the background on its first visit, so the page
+# renders right away and precomputed answers are served in the meantime.
+@st.cache_resource
+def get_registry():
+    return TenantRegistry(load_tenants(), LLMService(api_key=st.secrets["TOGETHER_API_KEY"]))
+
+registry = get_registry()
+
+# The persona is picked once per session with ?persona=<id>, the first one by
+# default
+if "tenant_id" not in st.session_state:
+    st.session_state.tenant_id = st.query_params.get("persona") or registry.default_id
+if st.session_state.tenant_id not in registry.tenants:
+    st.error(f"Unknown persona: {st.session_state.tenant_id}")
+    st.stop()
+tenant = registry.tenant(st.session_state.tenant_id)
+categories = tenant.categories
+pipeline = registry.get(tenant.id)
+engine = pipeline.engine
+
 # Title
-st.markdown('<div class="title">Ravi\'s Digital Self</div>', unsafe_allow_html=True)
+st.markdown(f'<div class="title">{html.escape(tenant.title)}</div>', unsafe_allow_html=True)
+
+if engine.knowledge_base_missing:
+    st.warning(f"{tenant.kb_path} not found")
 
 # Initialize session state
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "selected_category" not in st.session_state:
-    st.session_state.selected_category = "Basic"
+    st.session_state.selected_category = next(iter(categories), None)
 if "user_input" not in st.session_state:
     st.session_state.user_input = ""
-if "chroma_client" not in st.session_state:
-    # Initialize ChromaDB client
-    st.session_state.chroma_client = chromadb.Client()
-
-    # Create or get collection
-    embedding_function = SentenceTransformerEmbeddingFunction(
-        model_name="all-MiniLM-L6-v2"
-    )
-    
-    try:
-        # Try to get existing collection
-        st.session_state.collection = st.session_state.chroma_client.get_collection(
-            name="knowledge_base",
-            embedding_function=embedding_function
-        )
-    except:
-        # Create new collection if it doesn't exist
-        st.session_state.collection = st.session_state.chroma_client.create_collection(
-            name="knowledge_base",
-            embedding_function=embedding_function
-        )
-
-        # Load knowledge base
-        try:
-            with open("knowledge_base.jsonl", "r") as f:
-                for idx, line in enumerate(f):
-                    data = json.loads(line)
-                    # Store both question and answer as documents
-                    question = data["messages"][0]["content"]
-                    answer = data["messages"][1]["content"]
-                    st.session_state.collection.add(
-                        documents=[f"Q: {question}\nA: {answer}"],
-                        metadatas=[{"question": question}],
-                        ids=[str(idx)],
-                    )
-        except FileNotFoundError:
-            st.warning("knowledge_base.jsonl not found")
-
-# Initialize Together client
-together_client = Together(api_key=st.secrets["TOGETHER_API_KEY"])
-
-# Categories and questions
-categories = {
-    "Basic": [
-        "What is your educational background?",
-        "How did you get started in software engineering?",
-        "What programming languages do you know?",
-        "What are your strongest technical skills?",
-        "How to contact you?",
-    ],
-    "Work": [
-        "Where are you currently working?",
-        "What companies have you worked for?",
-        "What was your most challenging project?",
-        "What was your Current project?",
-        "What is your leadership experience?",
-    ],
-    "Skills": [
-        "Tell me about your software engineering experience.",
-        "What industries have you worked in?",
-        "What are your most impressive projects?",
-        "Do you have any open source contributions?",
-        "What technologies do you use in your projects?",
-    ],
-    "Hobbies": [
-        "What are your hobbies?",
-        "What do you like to do outside of work?",
-        "What project are you most proud of?",
-        "What are you learning right now?",
-        "Can you share your GitHub?",
-    ],
-}
+if "pending_request" not in st.session_state:
+    st.session_state.pending_request = None
+if "render_limit" not in st.session_state:
+    st.session_state.render_limit = config.RENDER_MESSAGES
+if "session_started" not in st.session_state:
+    st.session_state.session_started = time.perf_counter()
+    st.session_state.first_response_seconds = None
+    st.session_state.session_id = uuid.uuid4().hex
+    engine.register_session()
 
 # Function to select category
 def select_category(category):
     st.session_state.selected_category = category
 
-# Function to set question and trigger chat
-def handle_question_click(question):
-    # Add user message to history
-    st.session_state.messages.append({"role": "user", "content": question})
-    
-    # Perform semantic search with top 3 matches
-    similar_results = st.session_state.collection.query(
-        query_texts=[question], n_results=3
-    )
-    context = (
-        "\n".join([doc for doc in similar_results["documents"][0] if "A: " in doc])
-        if similar_results["documents"]
-        else ""
-    )
+# Rate limit key: the visitor's address as seen by the trusted proxy, else
+# the browser session
+def client_key():
+    return forwarded_client(st.context.headers.get("X-Forwarded-For")) or st.session_state.session_id
 
-    response = together_client.chat.completions.create(
-        model="meta-llama/Meta-Llama-3-8B-Instruct-Turbo",
-        messages=[
-            {"role": "system", "content": DEFAULT_SYSTEM_PROMPT},
-            {"role": "user", "content": question},
-            {
-                "role": "system",
-                "content": f"Please use the following information to craft a helpful and accurate response:\n{context}"
-                if context
-                else f"No additional information is available. Please provide a concise and professional response.",
-            },
-        ],
-    )
-    assistant_response = response.choices[0].message.content
+# Queue a question for the chat. Only questions that need a retrieval wait
+# for the engine while it is still loading.
+def submit(question):
+    if engine.ready():
+        return pipeline.submit(question, st.session_state.messages, client_key())
+    with st.spinner("Loading knowledge base..."):
+        return pipeline.submit(question, st.session_state.messages, client_key())
 
-    # Store assistant response
-    st.session_state.messages.append(
-        {"role": "assistant", "content": assistant_response}
-    )
-    
-    # Rerun to update the UI
-    st.rerun()
+# Function to set question and trigger chat
+def handle_question_click(question):
+    st.session_state.pending_request = submit(question)
 
 chat_input = st.chat_input("Type your message here...")
 
-# And update the chat input handler similarly:
 if user_input := chat_input:
     # Store last input to prevent duplicate submissions
     st.session_state.last_input = user_input
-    
-    # Add user message to history
-    st.session_state.messages.append({"role": "user", "content": user_input})
-    
-    # Perform semantic search with top 3 matches
-    similar_results = st.session_state.collection.query(
-        query_texts=[user_input], n_results=3
-    )
-    context = (
-        "\n".join([doc for doc in similar_results["documents"][0] if "A: " in doc])
-        if similar_results["documents"]
-        else ""
-    )
+    st.session_state.pending_request = submit(user_input)
 
-    response = together_client.chat.completions.create(
-        model="meta-llama/Meta-Llama-3-8B-Instruct-Turbo",
-        messages=[
-            {"role": "system", "content": DEFAULT_SYSTEM_PROMPT},
-            {"role": "user", "content": user_input},
-            {
-                "role": "system",
-                "content": f"Please use the following information to craft a helpful and accurate response:\n{context}"
-                if context
-                else f"No additional information is available. Please provide a concise and professional response.",
-            },
-        ],
-    )
-    assistant_response = response.choices[0].message.content
-
-    # Store assistant response
-    st.session_state.messages.append(
-        {"role": "assistant", "content": assistant_response}
-    )
-    
     # Clear input after submission
     st.session_state.user_input = ""
-    
-    # Rerun to update the UI
-    st.rerun()
-# Category buttons
-st.markdown('<div class="category-container">', unsafe_allow_html=True)
-cols = st.columns(len(categories))
-for i, category in enumerate(categories):
-    with cols[i]:
-        active_class = "active" if st.session_state.selected_category == category else ""
-        if st.button(category, key=f"cat_{category}", 
-                    use_container_width=True):
-            select_category(category)
-st.markdown('</div>', unsafe_allow_html=True)
-
-# Display questions for selected category
-st.markdown('<div class="question-container">', unsafe_allow_html=True)
-for question in categories[st.session_state.selected_category]:
-    if st.button(question, key=f"q_{question}", use_container_width=True):
-        handle_question_click(question)
-st.markdown('</div>', unsafe_allow_html=True)
 
-# Display chat messages
+# Category buttons
+if categories:
+    st.markdown('<div class="category-container">', unsafe_allow_html=True)
+    cols = st.columns(len(categories))
+    for i, category in enumerate(categories):
+        with cols[i]:
+            active_class = "active" if st.session_state.selected_category == category else ""
+            if st.button(category, key=f"cat_{category}", 
+                        use_container_width=True):
+                select_category(category)
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    # Display questions for selected category
+    st.markdown('<div class="question-container">', unsafe_allow_html=True)
+    for question in categories[st.session_state.selected_category]:
+        if st.button(question, key=f"q_{question}", use_container_width=True):
+            handle_question_click(question)
+    st.markdown('</div>', unsafe_allow_html=True)
+
+# Admin panel with live metrics, opened with ?admin=<ADMIN_TOKEN> in the URL
+def admin_requested():
+    token = st.query_params.get("admin", "")
+    return bool(config.ADMIN_TOKEN) and hmac.compare_digest(token.encode(), config.ADMIN_TOKEN.encode())
+
+if admin_requested():
+    with st.sidebar.expander("Admin", expanded=True):
+        snapshot = metrics.snapshot()
+        st.caption("Stage latency over the recent window (ms)")
+        st.dataframe(
+            [
+                {
+                    "stage": stage,
+                    "count": summary["count"],
+                    "p50": round(1000 * summary["p50"], 2),
+                    "p95": round(1000 * summary["p95"], 2),
+                    "p99": round(1000 * summary["p99"], 2),
+                }
+                for stage, summary in sorted(snapshot["stages"].items())
+            ],
+            hide_index=True,
+        )
+        st.caption("Counters")
+        st.json(snapshot["counters"])
+        stats = engine.stats() if engine.ready() else {"engine": "loading"}
+        stats["pipeline"] = pipeline.stats()
+        stats["tenants"] = registry.stats()
+        stats["first_response_seconds"] = st.session_state.first_response_seconds
+        st.caption("Engine and pipeline")
+        st.json(stats, expanded=False)
+
+# Display chat messages. Only the latest page of the transcript is rendered,
+# so a rerun costs the same however long the conversation gets.
 st.markdown('<div class="chat-container">', unsafe_allow_html=True)
-for message in st.session_state.messages:
+transcript = [m for m in st.session_state.messages if m["role"] != SUMMARY_ROLE]
+hidden = len(transcript) - st.session_state.render_limit
+if hidden > 0 and st.button(
+    f"Show earlier messages ({hidden})", key="show_earlier", use_container_width=True
+):
+    st.session_state.render_limit += config.RENDER_MESSAGES
+    hidden -= config.RENDER_MESSAGES
+for message in transcript[max(hidden, 0):]:
     with st.chat_message(message["role"]):
         st.write(message["content"])
 st.markdown('</div>', unsafe_allow_html=True)
 
-# Single chat input at the bottom
-if user_input := chat_input:
-    # Store last input to prevent duplicate submissions
-    st.session_state.last_input = user_input
-    
-    # Add user message to history
-    st.session_state.messages.append({"role": "user", "content": user_input})
-    
-    # Perform semantic search with top 3 matches
-    similar_results = st.session_state.collection.query(
-        query_texts=[user_input], n_results=3
-    )
-    context = (
-        "\n".join([doc for doc in similar_results["documents"][0] if "A: " in doc])
-        if similar_results["documents"]
-        else ""
-    )
-
-    # Generate response using LLM
-    response = together_client.chat.completions.create(
-        model="meta-llama/Meta-Llama-3-8B-Instruct-Turbo",
-        messages=[
-            {"role": "system", "content": DEFAULT_SYSTEM_PROMPT},
-            {"role": "user", "content": user_input},
-            {
-                "role": "system",
-                "content": f"Please use the following information to craft a helpful and accurate response:\n{context}"
-                if context
-                else f"No additional information is available. Please provide a concise and professional response.",
-            },
-        ],
-    )
-    assistant_response = response.choices[0].message.content
+# Time to render the page, the cost every rerun pays before any answer work
+metrics.observe("rerun", time.perf_counter() - run_started)
+
+# Stream the answer to a queued request into a new chat bubble
+if st.session_state.pending_request is not None:
+    request = st.session_state.pending_request
+    st.session_state.pending_request = None
+    timings = {}
+    with st.chat_message("assistant"):
+        answer = pipeline.generate(request, timings)
+        if pipeline.stream:
+            answer = st.write_stream(answer)
+        else:
+            st.write(answer)
+    pipeline.record(request, st.session_state.messages, answer, timings)
+    if st.session_state.first_response_seconds is None:
+        st.session_state.first_response_seconds = (
+            time.perf_counter() - st.session_state.session_started
+        )
 
-    # Store assistant response
-    st.session_state.messages.append(
-        {"role": "assistant", "content": assistant_response}
-    )
-    
     # Rerun to update the UI
     st.rerun()
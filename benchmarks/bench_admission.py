@@ -0,0 +1,130 @@
+import argparse
+import json
+import threading
+import time
+
+import config
+from admission import RateLimiter
+from answer_cache import AnswerCache
+from benchmarks.bench_e2e import start_fake_endpoint, synthetic_query_log
+from benchmarks.stubs import stub_engine
+from llm_service import LLMService
+from pipeline import AnswerPipeline
+from utils import percentile
+
+
+# Every user is its own client and asks per_user questions, pausing
+# think_seconds in between; the spammer asks four times as many without pausing
+def run_level(pipeline, queries, users, per_user, think_seconds, spammer):
+    samples = []
+    lock = threading.Lock()
+
+    def user(index, pause, count):
+        own = []
+        for i in range(count):
+            # Unique text, so that neither the answer cache nor request
+            # coalescing hides the load
+            question = f"{queries[(index * per_user + i) % len(queries)]} ({index}.{i})"
+            started = time.perf_counter()
+            request = pipeline.submit(question, [], client=f"user-{index}")
+            timings = {}
+            answer = pipeline.generate(request, timings)
+            pipeline.record(request, [], answer, timings)
+            outcome = request["degraded"] or ("cached" if timings.get("cached") else "llm")
+            own.append((outcome, 1000 * (time.perf_counter() - started)))
+            if pause:
+                time.sleep(pause)
+        with lock:
+            samples.extend(own)
+
+    depths = []
+    done = threading.Event()
+
+    def monitor():
+        while not done.is_set():
+            depths.append(pipeline.llm.queue_depth())
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=user, args=(i, think_seconds, per_user)) for i in range(users)]
+    if spammer:
+        threads.append(threading.Thread(target=user, args=(users, 0.0, 4 * per_user)))
+    watcher = threading.Thread(target=monitor, daemon=True)
+    watcher.start()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    done.set()
+
+    report = {
+        "requests": len(samples),
+        "wall_seconds": round(wall, 2),
+        "max_queue_depth": max(depths, default=0),
+    }
+    for outcome in ("all", "llm", "overloaded", "rate_limited", "cached"):
+        latencies = sorted(ms for kind, ms in samples if outcome in ("all", kind))
+        if latencies:
+            report[outcome] = {
+                "count": len(latencies),
+                "p50_ms": round(percentile(latencies, 50), 1),
+                "p95_ms": round(percentile(latencies, 95), 1),
+            }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate limiting and load shedding against a fake LLM endpoint")
+    parser.add_argument("--path", default=config.KNOWLEDGE_BASE_PATH)
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--per-user", type=int, default=5)
+    parser.add_argument("--think-seconds", type=float, default=1.0)
+    parser.add_argument("--spammer", action="store_true", help="add one client that never pauses")
+    parser.add_argument("--max-waiting", default="0,8", help="comma separated LLM_MAX_WAITING values")
+    parser.add_argument("--concurrency", type=int, default=config.LLM_MAX_CONCURRENCY)
+    parser.add_argument("--per-minute", type=float, default=config.RATE_LIMIT_PER_MINUTE)
+    parser.add_argument("--burst", type=int, default=config.RATE_LIMIT_BURST)
+    parser.add_argument("--latency", type=float, default=1.0, help="fake LLM seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--answer-tokens", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8902)
+    parser.add_argument("--output", help="save the report as JSON")
+    args = parser.parse_args()
+
+    start_fake_endpoint(args.port, args.latency, args.tokens_per_second, args.answer_tokens)
+    llm = LLMService("fake", base_url=f"http://127.0.0.1:{args.port}/v1", max_concurrency=args.concurrency)
+    engine = stub_engine(args.path)
+    queries = synthetic_query_log(args.path, 200)
+
+    report = {"config": vars(args), "results": []}
+    for max_waiting in [int(n) for n in args.max_waiting.split(",")]:
+        pipeline = AnswerPipeline(
+            engine,
+            llm,
+            stream=False,
+            cache=AnswerCache(max_entries=0),
+            rate_limiter=RateLimiter(args.per_minute, args.burst),
+            max_llm_waiting=max_waiting,
+        )
+        level = run_level(pipeline, queries, args.users, args.per_user, args.think_seconds, args.spammer)
+        level = {"max_waiting": max_waiting, **level}
+        report["results"].append(level)
+        summary = "  ".join(
+            f"{outcome} {level[outcome]['count']} (p95 {level[outcome]['p95_ms']:.0f} ms)"
+            for outcome in ("llm", "overloaded", "rate_limited", "cached")
+            if outcome in level
+        )
+        print(
+            f"max_waiting={max_waiting:<3} all p50 {level['all']['p50_ms']:.0f} ms "
+            f"p95 {level['all']['p95_ms']:.0f} ms  queue<= {level['max_queue_depth']}  {summary}"
+        )
+
+    llm.close()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import json
+import threading
+import time
+
+import config
+from benchmarks.bench_retrieval import build_queries
+from benchmarks.stubs import stub_engine, temp_index_dir
+from embedding_cache import EmbeddingCache
+from utils import percentile
+
+
+# "window_ms/max_batch", for example "0/1" (no batching) or "2/32"
+def make_engine(args, index_dir, spec):
+    window_ms, max_batch = spec.split("/")
+    engine = stub_engine(
+        args.path,
+        backend=args.embedding,
+        index_dir=index_dir,
+        embedding_options={"delay_ms": args.delay_ms, "item_delay_ms": args.item_delay_ms},
+        retrieval_mode="dense",
+        vector_store=args.vector_store,
+        batch_window_ms=float(window_ms),
+        batch_max_size=int(max_batch),
+    )
+    # Every query has to be encoded, as for a stream of new questions
+    engine.encoder.cache = EmbeddingCache(engine.embedding_key, max_entries=0)
+    return engine
+
+
+# Every user thread sends its queries back to back
+def run_level(engine, queries, users, per_user, k):
+    latencies = []
+    lock = threading.Lock()
+
+    def user(offset):
+        own = []
+        for i in range(per_user):
+            text = queries[(offset * per_user + i) % len(queries)]
+            started = time.perf_counter()
+            engine.search(text, n_results=k)
+            own.append(1000 * (time.perf_counter() - started))
+        with lock:
+            latencies.extend(own)
+
+    before = engine.stats()["batching"]["encode"]
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    after = engine.stats()["batching"]["encode"]
+    batches = after["batches"] - before["batches"]
+    latencies.sort()
+    return {
+        "users": users,
+        "queries": len(latencies),
+        "throughput_qps": round(len(latencies) / wall, 1),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_encode_batch": round((after["items"] - before["items"]) / batches, 2) if batches else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and latency of micro-batched retrieval")
+    parser.add_argument("--path", default=config.KNOWLEDGE_BASE_PATH)
+    parser.add_argument("--configs", default="0/1,1/8,2/32,5/32", help="comma separated window_ms/max_batch")
+    parser.add_argument("--users", default="1,4,16,32", help="concurrency levels")
+    parser.add_argument("--per-user", type=int, default=40, help="queries per user and level")
+    parser.add_argument("-k", type=int, default=config.N_RESULTS)
+    parser.add_argument("--embedding", choices=["stub", "torch", "onnx"], default="stub")
+    parser.add_argument("--delay-ms", type=float, default=4.0, help="stub cost per encode call")
+    parser.add_argument("--item-delay-ms", type=float, default=0.5, help="stub cost per encoded text")
+    parser.add_argument("--vector-store", choices=["chroma", "numpy"], default=config.VECTOR_STORE)
+    parser.add_argument("--output", help="save the report as JSON")
+    args = parser.parse_args()
+
+    queries = [query["text"] for query in build_queries(args.path)]
+    index_dir = temp_index_dir(prefix="bench-batching-")
+    report = {"embedding": args.embedding, "vector_store": args.vector_store, "results": []}
+    for spec in args.configs.split(","):
+        engine = make_engine(args, index_dir, spec)
+        engine.search("warm up", n_results=args.k)
+        for users in [int(n) for n in args.users.split(",")]:
+            level = {"config": spec, **run_level(engine, queries, users, args.per_user, args.k)}
+            report["results"].append(level)
+            print(
+                f"{spec:<6} users={users:<3} {level['throughput_qps']:>8.1f} q/s  "
+                f"p50 {level['p50_ms']:>7.2f} ms  p95 {level['p95_ms']:>7.2f} ms  "
+                f"batch {level['mean_encode_batch']:.1f}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
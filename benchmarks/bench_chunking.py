@@ -0,0 +1,103 @@
+import argparse
+import json
+import time
+
+import config
+from benchmarks.bench_retrieval import build_queries
+from benchmarks.stubs import document_question, stub_engine
+from context_builder import estimate_tokens
+from utils import percentile
+from warmup import category_questions
+
+
+# Category questions target the record stored under the same question; the
+# keyword and prefix rewrites of every stored question target their record
+def build_workload(path):
+    queries = [{"kind": "category", "text": q, "target": q} for q in category_questions()]
+    for query in build_queries(path):
+        queries.append({"kind": query["kind"], "text": query["text"], "target": document_question(query["target"])})
+    return queries
+
+
+def make_engine(args, index_mode):
+    return stub_engine(
+        args.path,
+        backend="stub" if args.embedding == "stub" else config.EMBEDDING_BACKEND,
+        prefix=f"bench-{index_mode}-",
+        index_mode=index_mode,
+        chunk_tokens=args.chunk_tokens,
+    )
+
+
+# Hit rate and MRR of the target record within the top k records, and the
+# size of the retrieved context, split into tokens of the target record and
+# of everything else
+def evaluate(engine, queries, mode, k):
+    results = {}
+    for query in queries:
+        started = time.perf_counter()
+        documents = engine.search(query["text"], n_results=k, mode=mode)
+        latency = 1000 * (time.perf_counter() - started)
+        questions = [document_question(document) for document in documents]
+        rank = questions.index(query["target"]) + 1 if query["target"] in questions else None
+        tokens = [estimate_tokens(document) for document in documents]
+        target_tokens = tokens[rank - 1] if rank else 0
+        for kind in ("all", query["kind"]):
+            bucket = results.setdefault(
+                kind, {"hits": 0, "rr": 0.0, "tokens": 0, "target_tokens": 0, "latencies": []}
+            )
+            bucket["hits"] += rank is not None
+            bucket["rr"] += 1 / rank if rank else 0.0
+            bucket["tokens"] += sum(tokens)
+            bucket["target_tokens"] += target_tokens
+            bucket["latencies"].append(latency)
+
+    report = {}
+    for kind, bucket in results.items():
+        count = len(bucket["latencies"])
+        latencies = sorted(bucket["latencies"])
+        report[kind] = {
+            "queries": count,
+            f"hit@{k}": round(bucket["hits"] / count, 3),
+            "mrr": round(bucket["rr"] / count, 3),
+            "context_tokens": round(bucket["tokens"] / count, 1),
+            "target_share": round(bucket["target_tokens"] / bucket["tokens"], 3) if bucket["tokens"] else 0.0,
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chunked and whole-record retrieval")
+    parser.add_argument("--path", default=config.KNOWLEDGE_BASE_PATH)
+    parser.add_argument("-k", type=int, default=config.N_RESULTS)
+    parser.add_argument("--modes", default="dense,hybrid")
+    parser.add_argument("--chunk-tokens", type=int, default=config.CHUNK_MAX_TOKENS)
+    parser.add_argument("--embedding", choices=["stub", "model"], default="model")
+    parser.add_argument("--output", help="save the report as JSON")
+    args = parser.parse_args()
+
+    queries = build_workload(args.path)
+    report = {"queries": len(queries), "chunk_tokens": args.chunk_tokens, "results": []}
+    for index_mode in ("record", "chunk"):
+        engine = make_engine(args, index_mode)
+        engine.embed("warm up")
+        for mode in args.modes.split(","):
+            report["results"].append(
+                {
+                    "index_mode": index_mode,
+                    "retrieval_mode": mode,
+                    "indexed": engine.collection.count(),
+                    **evaluate(engine, queries, mode, args.k),
+                }
+            )
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
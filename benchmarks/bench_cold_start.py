@@ -0,0 +1,103 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+# What app.py imports before it renders anything, including the modules the
+# tenant registry imports when it sets up the first persona
+APP_IMPORTS = [
+    "streamlit", "config", "admission", "conversation", "llm_service", "metrics", "tenants",
+    "pipeline", "retrieval", "warmup",
+]
+
+# Modules that must stay out of the page shell and only load with the engine
+HEAVY_MODULES = ["chromadb", "torch", "sentence_transformers", "transformers", "onnxruntime", "together"]
+
+
+# Per-module import times of the app imports in a fresh interpreter, from
+# python -X importtime
+def import_profile(modules):
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        capture_output=True, text=True, check=True,
+    ).stderr
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    return entries
+
+
+# Runs in a fresh interpreter: time until the page shell could render, until
+# the engine is loaded and until the first query is embedded
+def worker():
+    started = time.perf_counter()
+    for module in APP_IMPORTS:
+        __import__(module)
+    shell_seconds = time.perf_counter() - started
+    heavy_at_shell = [module for module in HEAVY_MODULES if module in sys.modules]
+
+    from retrieval import LazyEngine
+
+    engine = LazyEngine()
+    engine.get()
+    engine_seconds = time.perf_counter() - started
+    engine.embed("warm up")
+    first_query_seconds = time.perf_counter() - started
+    return {
+        "shell_seconds": round(shell_seconds, 3),
+        "engine_ready_seconds": round(engine_seconds, 3),
+        "first_query_seconds": round(first_query_seconds, 3),
+        "heavy_modules_at_shell": heavy_at_shell,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start and import-time profile of the app")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--skip-engine", action="store_true", help="only profile the imports")
+    parser.add_argument("--output", help="save the report as JSON")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker()))
+        return
+
+    entries = import_profile(APP_IMPORTS)
+    roots = [entry for entry in entries if entry["depth"] == 0]
+    report = {
+        "import_seconds": round(sum(entry["cumulative_ms"] for entry in roots) / 1000, 3),
+        "app_imports": {
+            entry["module"]: round(entry["cumulative_ms"], 1)
+            for entry in roots
+            if entry["module"] in APP_IMPORTS
+        },
+        "slowest_imports": [
+            {"module": entry["module"], "cumulative_ms": round(entry["cumulative_ms"], 1)}
+            for entry in sorted(entries, key=lambda e: -e["cumulative_ms"])[: args.top]
+        ],
+    }
+    if not args.skip_engine:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_cold_start", "--worker"],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        report.update(json.loads(output.strip().splitlines()[-1]))
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
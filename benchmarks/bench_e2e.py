@@ -0,0 +1,195 @@
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+import uvicorn
+
+import config
+from answer_cache import AnswerCache
+from benchmarks.fake_together import create_app
+from benchmarks.stubs import stub_engine
+from knowledge_base import STOPWORDS, load_records, tokenize
+from llm_service import LLMService
+from pipeline import AnswerPipeline
+from utils import current_rss_mb, git_commit, peak_rss_mb, percentile
+from warmup import category_questions
+
+OFF_TOPIC = [
+    "What is the capital of France?",
+    "Can you recommend a good pizza place?",
+    "How tall is Mount Everest?",
+    "Write me a poem about the sea.",
+]
+
+
+# Run the fake Together endpoint in a background thread
+def start_fake_endpoint(port, latency, tokens_per_second, answer_tokens):
+    app = create_app(latency, tokens_per_second, answer_tokens)
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+# Synthetic visitor traffic: category buttons, stored questions, keyword-only
+# rewrites of stored questions and off-topic questions
+def synthetic_query_log(kb_path, size, seed=0):
+    rng = random.Random(seed)
+    stored = [record["question"] for record in load_records(kb_path)]
+    categories = category_questions()
+    queries = []
+    for _ in range(size):
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(rng.choice(categories))
+        elif kind < 0.6:
+            queries.append(rng.choice(stored))
+        elif kind < 0.9:
+            tokens = tokenize(rng.choice(stored))
+            queries.append(" ".join(t for t in tokens if t not in STOPWORDS) or "hello")
+        else:
+            queries.append(rng.choice(OFF_TOPIC))
+    return queries
+
+
+# Replay queries through the same calls as a question click in app.py
+def replay(pipeline, queries, samples, lock):
+    for question in queries:
+        started = time.perf_counter()
+        history = []
+        request = pipeline.submit(question, history)
+        timings = {}
+        answer = pipeline.generate(request, timings)
+        if not isinstance(answer, str):
+            answer = "".join(answer)
+        pipeline.record(request, history, answer, timings)
+        sample = {f"{name}_seconds": value for name, value in request["stages"].items()}
+        sample["ttft_seconds"] = timings.get("ttft_seconds") or 0.0
+        sample["generation_seconds"] = timings.get("total_seconds") or 0.0
+        sample["total_seconds"] = time.perf_counter() - started
+        with lock:
+            samples.append(sample)
+
+
+def summarize(samples):
+    stages = sorted({name for sample in samples for name in sample})
+    summary = {}
+    for stage in stages:
+        values = sorted(1000 * sample.get(stage, 0.0) for sample in samples)
+        summary[stage.replace("_seconds", "_ms")] = {
+            "p50": round(percentile(values, 50), 3),
+            "p95": round(percentile(values, 95), 3),
+            "p99": round(percentile(values, 99), 3),
+        }
+    return summary
+
+
+def run_level(engine, llm, queries, users, use_cache):
+    cache = AnswerCache() if use_cache else AnswerCache(max_entries=0)
+    pipeline = AnswerPipeline(engine, llm, cache=cache)
+    samples = []
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=replay, args=(pipeline, queries[i::users], samples, lock))
+        for i in range(users)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    return {
+        "users": users,
+        "requests": len(samples),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(samples) / wall, 2),
+        "latency": summarize(samples),
+        "pipeline": pipeline.stats(),
+        "rss_mb": round(current_rss_mb(), 1),
+    }
+
+
+# p95 of every stage against a previous run, per concurrency level
+def compare(results, baseline_path):
+    with open(baseline_path, "r") as f:
+        baseline = {level["users"]: level for level in json.load(f)["results"]}
+    for level in results:
+        previous = baseline.get(level["users"])
+        if previous is None:
+            continue
+        print(f"users={level['users']}")
+        for stage, current in level["latency"].items():
+            before = previous["latency"].get(stage)
+            if before is None:
+                continue
+            delta = current["p95"] - before["p95"]
+            print(f"  {stage:<22} p95 {before['p95']:>9.2f} -> {current['p95']:>9.2f} ms ({delta:+.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end latency benchmark")
+    parser.add_argument("--path", default=config.KNOWLEDGE_BASE_PATH)
+    parser.add_argument("--queries", type=int, default=200, help="synthetic log size")
+    parser.add_argument("--query-log", help="file with one query per line instead")
+    parser.add_argument("--users", default="1,4,16", help="concurrency levels")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake LLM seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--answer-tokens", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--embedding", choices=["stub", "model"], default="stub")
+    parser.add_argument("--embed-delay-ms", type=float, default=0.0, help="stub encode cost")
+    parser.add_argument("--no-cache", action="store_true", help="disable the answer cache")
+    parser.add_argument("--output", default="bench_e2e.json")
+    parser.add_argument("--baseline", help="previous output to compare against")
+    args = parser.parse_args()
+
+    start_fake_endpoint(args.port, args.latency, args.tokens_per_second, args.answer_tokens)
+    llm = LLMService("fake", base_url=f"http://127.0.0.1:{args.port}/v1")
+
+    # Stub vectors must never end up in the real index
+    if args.embedding == "stub":
+        engine = stub_engine(args.path, embedding_options={"delay_ms": args.embed_delay_ms})
+    else:
+        engine = stub_engine(args.path, backend=config.EMBEDDING_BACKEND)
+
+    if args.query_log:
+        with open(args.query_log, "r") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = category_questions() + synthetic_query_log(args.path, args.queries)
+
+    results = []
+    for users in [int(n) for n in args.users.split(",")]:
+        level = run_level(engine, llm, queries, users, use_cache=not args.no_cache)
+        results.append(level)
+        print(
+            f"users={users:<3} {level['throughput_rps']:>8.2f} req/s  "
+            f"total p50 {level['latency']['total_ms']['p50']:.1f} ms  "
+            f"p95 {level['latency']['total_ms']['p95']:.1f} ms  "
+            f"p99 {level['latency']['total_ms']['p99']:.1f} ms"
+        )
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "config": vars(args),
+        "engine": engine.stats(),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
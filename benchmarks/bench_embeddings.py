@@ -0,0 +1,175 @@
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import config
+from benchmarks.bench_retrieval import build_queries
+from knowledge_base import format_document, load_records
+from utils import current_rss_mb, percentile
+from warmup import category_questions
+
+# Libraries each backend pulls in, timed separately from loading the model
+BACKEND_IMPORTS = {
+    "torch": ["torch", "sentence_transformers"],
+    "onnx": ["onnxruntime", "tokenizers"],
+}
+
+
+def corpus(path):
+    documents = []
+    seen = set()
+    for record in load_records(path):
+        document = format_document(record["question"], record["answer"])
+        if document not in seen:
+            seen.add(document)
+            documents.append(document)
+    return documents
+
+
+def workload(path):
+    queries = [{"text": q, "target": None} for q in category_questions()]
+    return queries + build_queries(path)
+
+
+# Runs in a fresh interpreter per backend so import time and RSS are not
+# shared: load the backend, time single-query encodes and a bulk encode of the
+# knowledge base, and save every vector for the comparison
+def worker(backend, path, vectors_path):
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    for module in BACKEND_IMPORTS[backend]:
+        importlib.import_module(module)
+    import_seconds = time.perf_counter() - started
+
+    from embeddings import make_embedding_function
+
+    embedding_function = make_embedding_function(backend)
+    load_seconds = time.perf_counter() - started
+    rss_loaded = current_rss_mb()
+
+    started = time.perf_counter()
+    embedding_function(["warm up"])
+    first_encode_seconds = time.perf_counter() - started
+
+    queries = [query["text"] for query in workload(path)]
+    latencies = []
+    query_vectors = []
+    for text in queries:
+        started = time.perf_counter()
+        query_vectors.append(embedding_function([text])[0])
+        latencies.append(1000 * (time.perf_counter() - started))
+    latencies.sort()
+
+    documents = corpus(path)
+    started = time.perf_counter()
+    document_vectors = embedding_function(documents)
+    bulk_seconds = time.perf_counter() - started
+
+    np.savez(
+        vectors_path,
+        queries=np.asarray(query_vectors, dtype=np.float32),
+        documents=np.asarray(document_vectors, dtype=np.float32),
+    )
+    return {
+        "backend": backend,
+        "import_seconds": round(import_seconds, 3),
+        "load_seconds": round(load_seconds, 3),
+        "first_encode_ms": round(1000 * first_encode_seconds, 2),
+        "encode_p50_ms": round(percentile(latencies, 50), 3),
+        "encode_p95_ms": round(percentile(latencies, 95), 3),
+        "encode_mean_ms": round(sum(latencies) / len(latencies), 3),
+        "documents_per_second": round(len(documents) / bulk_seconds, 1),
+        "rss_loaded_mb": round(rss_loaded - rss_before, 1),
+        "rss_mb": round(current_rss_mb(), 1),
+    }
+
+
+def run_worker(backend, path, vectors_path):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_embeddings", "--worker", backend,
+         "--path", path, "--vectors", vectors_path],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def top_k(query_vectors, document_vectors, k):
+    scores = query_vectors @ document_vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+# Retrieval with the candidate vectors against the reference vectors: top-1
+# agreement, overlap of the top k, query vector cosine and recall of the
+# target document for the queries that have one
+def equivalence(reference, candidate, queries, documents, k):
+    reference_top = top_k(reference["queries"], reference["documents"], k)
+    candidate_top = top_k(candidate["queries"], candidate["documents"], k)
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(reference_top, candidate_top)]
+    cosine = np.sum(reference["queries"] * candidate["queries"], axis=1)
+
+    position = {document: i for i, document in enumerate(documents)}
+    targeted = [i for i, query in enumerate(queries) if query["target"] is not None]
+
+    def recall(top):
+        hits = sum(position[queries[i]["target"]] in top[i] for i in targeted)
+        return round(hits / len(targeted), 3) if targeted else None
+
+    return {
+        "top1_agreement": round(float(np.mean(reference_top[:, 0] == candidate_top[:, 0])), 3),
+        f"overlap@{k}": round(float(np.mean(overlap)), 3),
+        "query_cosine_mean": round(float(np.mean(cosine)), 4),
+        "query_cosine_min": round(float(np.min(cosine)), 4),
+        f"reference_recall@{k}": recall(reference_top),
+        f"candidate_recall@{k}": recall(candidate_top),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends")
+    parser.add_argument("--path", default=config.KNOWLEDGE_BASE_PATH)
+    parser.add_argument("--backends", default="torch,onnx", help="first one is the reference")
+    parser.add_argument("-k", type=int, default=config.N_RESULTS)
+    parser.add_argument(
+        "--min-agreement", type=float, default=0.95,
+        help="fail when top-1 agreement with the reference falls below this",
+    )
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--vectors", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.path, args.vectors)))
+        return
+
+    backends = args.backends.split(",")
+    queries = workload(args.path)
+    documents = corpus(args.path)
+    results = []
+    vectors = {}
+    with tempfile.TemporaryDirectory(prefix="bench-embeddings-") as tmp:
+        for backend in backends:
+            vectors_path = os.path.join(tmp, f"{backend}.npz")
+            results.append(run_worker(backend, args.path, vectors_path))
+            vectors[backend] = dict(np.load(vectors_path))
+
+    failed = False
+    for result in results[1:]:
+        result["equivalence"] = equivalence(
+            vectors[backends[0]], vectors[result["backend"]], queries, documents, args.k
+        )
+        failed |= result["equivalence"]["top1_agreement"] < args.min_agreement
+    print(json.dumps({"queries": len(queries), "documents": len(documents), "results": results}, indent=2))
+    if failed:
+        print(f"Top-1 agreement below {args.min_agreement} against {backends[0]}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
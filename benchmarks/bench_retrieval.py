@@ -0,0 +1,66 @@
+import argparse
+import json
+import statistics
+import time
+
+import config
+from knowledge_base import STOPWORDS, format_document, load_records, tokenize
+from retrieval import RetrievalEngine
+
+
+# Queries derived from the stored questions that the hash-index fast path
+# cannot answer: the keywords only, and the first half of the question
+def build_queries(path):
+    queries = []
+    seen = set()
+    for record in load_records(path):
+        document = format_document(record["question"], record["answer"])
+        if document in seen:
+            continue
+        seen.add(document)
+        tokens = tokenize(record["question"])
+        keywords = [token for token in tokens if token not in STOPWORDS]
+        if keywords:
+            queries.append({"kind": "keywords", "text": " ".join(keywords), "target": document})
+        if len(tokens) >= 4:
+            half = " ".join(tokens[: len(tokens) // 2 + 1])
+            queries.append({"kind": "prefix", "text": half, "target": document})
+    return queries
+
+
+def run(engine, queries, mode, k):
+    hits = 0
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        documents = engine.search(query["text"], n_results=k, mode=mode)
+        latencies.append(1000 * (time.perf_counter() - started))
+        hits += query["target"] in documents
+    latencies.sort()
+    return {
+        "mode": mode,
+        "k": k,
+        "queries": len(queries),
+        f"recall@{k}": round(hits / len(queries), 3),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare dense, lexical and hybrid retrieval")
+    parser.add_argument("--path", default=config.KNOWLEDGE_BASE_PATH)
+    parser.add_argument("-k", type=int, default=config.N_RESULTS)
+    parser.add_argument("--modes", default="dense,lexical,hybrid")
+    args = parser.parse_args()
+
+    engine = RetrievalEngine(kb_path=args.path)
+    queries = build_queries(args.path)
+    # Warm the model so the first mode does not pay for it
+    engine.embed("warm up")
+    results = [run(engine, queries, mode, args.k) for mode in args.modes.split(",")]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from utils import current_rss_mb, percentile
+
+COLLECTION = "bench"
+
+
+# Unit vectors around a few hundred centres, so that neighbours are not all at
+# the same distance as they would be for uniform noise in 384 dimensions
+def synthetic_vectors(count, dim, seed):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((256, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, len(centres), count)]
+    vectors = vectors + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_client(store, path):
+    if store == "numpy":
+        from vector_store import NumpyClient
+
+        return NumpyClient(path)
+    import chromadb
+
+    return chromadb.PersistentClient(path=path)
+
+
+def directory_mb(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        size += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return size / 2**20
+
+
+# Anonymous memory of this process in MB, which no other process can share.
+# Pages of a read-only memory map are file-backed and shared between every
+# process that maps the file, so they are not counted.
+def anonymous_mb():
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            return sum(int(line.split()[1]) for line in f if line.startswith("Anonymous:")) / 1024
+    except OSError:
+        return None
+
+
+def build(store, path, vectors):
+    client = make_client(store, path)
+    collection = client.get_or_create_collection(name=COLLECTION, embedding_function=None)
+    batch_size = min(5000, client.get_max_batch_size())
+    started = time.perf_counter()
+    for start in range(0, len(vectors), batch_size):
+        batch = vectors[start : start + batch_size]
+        ids = [str(i) for i in range(start, start + len(batch))]
+        collection.add(
+            ids=ids,
+            embeddings=batch,
+            documents=[f"Q: question {i}\nA: answer {i}" for i in ids],
+            metadatas=[{"question": f"question {i}"} for i in ids],
+        )
+    collection.modify(metadata={"kb_fingerprint": "bench"})
+    return time.perf_counter() - started
+
+
+# Runs in a fresh interpreter per store and size: open the index, time top-k
+# queries one at a time and measure recall against the exact neighbours
+def worker(store, path, queries_path, k):
+    data = np.load(queries_path)
+    queries, exact = data["queries"], data["exact"]
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    collection = make_client(store, path).get_or_create_collection(name=COLLECTION, embedding_function=None)
+    collection.query(query_embeddings=[queries[0]], n_results=k, include=[])
+    open_seconds = time.perf_counter() - started
+
+    latencies = []
+    hits = 0
+    for query, neighbours in zip(queries, exact):
+        started = time.perf_counter()
+        result = collection.query(query_embeddings=[query], n_results=k, include=["documents"])
+        latencies.append(1000 * (time.perf_counter() - started))
+        hits += len({int(idx) for idx in result["ids"][0]} & set(neighbours.tolist()))
+    latencies.sort()
+
+    started = time.perf_counter()
+    collection.query(query_embeddings=queries, n_results=k, include=["documents"])
+    batch_seconds = time.perf_counter() - started
+    anonymous = anonymous_mb()
+    return {
+        "open_seconds": round(open_seconds, 3),
+        "query_p50_ms": round(percentile(latencies, 50), 3),
+        "query_p95_ms": round(percentile(latencies, 95), 3),
+        "batch_queries_per_second": round(len(queries) / batch_seconds, 1),
+        f"recall@{k}": round(hits / (len(queries) * k), 4),
+        "rss_mb": round(current_rss_mb() - rss_before, 1),
+        "anonymous_mb": round(anonymous, 1) if anonymous is not None else None,
+    }
+
+
+def run_worker(store, path, queries_path, k):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_vector_store", "--worker", store,
+         "--index", path, "--query-vectors", queries_path, "-k", str(k)],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the Chroma and numpy vector stores")
+    parser.add_argument("--sizes", default="100,10000,100000")
+    parser.add_argument("--stores", default="chroma,numpy")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--output", help="save the report as JSON")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--index", help=argparse.SUPPRESS)
+    parser.add_argument("--query-vectors", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.index, args.query_vectors, args.k)))
+        return
+
+    report = {"dim": args.dim, "queries": args.queries, "k": args.k, "results": []}
+    with tempfile.TemporaryDirectory(prefix="bench-vector-store-") as tmp:
+        for size in (int(size) for size in args.sizes.split(",")):
+            vectors = synthetic_vectors(size, args.dim, seed=size)
+            queries = synthetic_vectors(args.queries, args.dim, seed=size + 1)
+            exact = np.argsort(-(queries @ vectors.T), axis=1)[:, : args.k]
+            queries_path = os.path.join(tmp, f"queries-{size}.npz")
+            np.savez(queries_path, queries=queries, exact=exact)
+            for store in args.stores.split(","):
+                path = os.path.join(tmp, f"{store}-{size}")
+                build_seconds = build(store, path, vectors)
+                result = {
+                    "store": store,
+                    "records": size,
+                    "build_seconds": round(build_seconds, 3),
+                    "disk_mb": round(directory_mb(path), 1),
+                    **run_worker(store, path, queries_path, args.k),
+                }
+                report["results"].append(result)
+                print(
+                    f"{store:<7} {size:>7}  build {result['build_seconds']:.2f}s  "
+                    f"open {result['open_seconds']:.3f}s  p50 {result['query_p50_ms']:.3f} ms  "
+                    f"p95 {result['query_p95_ms']:.3f} ms  recall@{args.k} {result[f'recall@{args.k}']:.3f}  "
+                    f"disk {result['disk_mb']:.1f} MB  anonymous {result['anonymous_mb']} MB",
+                    file=sys.stderr,
+                )
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+
+import config
+from benchmarks import bench_retrieval, eval_retrieval
+from benchmarks.stubs import document_question, stub_engine
+from relevance import filter_hits, save_thresholds
+from utils import percentile
+
+OFF_TOPIC_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "off_topic.txt")
+
+
+# On-topic queries with the question of the record they should find:
+# paraphrases from the fixture and keyword or prefix rewrites of every stored
+# question. Stored questions themselves are answered by the hash index.
+def on_topic_queries(kb_path, paraphrases_path):
+    queries = [
+        {"text": query["text"], "target": query["target"]}
+        for query in eval_retrieval.build_queries(kb_path, eval_retrieval.load_paraphrases(paraphrases_path))
+        if query["kind"] == "paraphrase"
+    ]
+    for query in bench_retrieval.build_queries(kb_path):
+        queries.append({"text": query["text"], "target": document_question(query["target"])})
+    return queries
+
+
+def off_topic_queries(path=OFF_TOPIC_PATH):
+    with open(path, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def make_engine(kb_path, backend):
+    return stub_engine(
+        kb_path,
+        backend=backend,
+        prefix="calibrate-index-",
+        index_mode="record",
+        batch_window_ms=0,
+        relevance={"min_score": None, "margin": None},
+    )
+
+
+# Similarities of the best hit and of the target record, for every query
+def score(engine, queries, depth):
+    scored = []
+    for query in queries:
+        ids, documents, scores = engine.dense_hits(query["text"], depth)
+        target = target_id = None
+        for idx, document, value in zip(ids, documents, scores):
+            if query.get("target") is not None and document_question(document) == query["target"]:
+                target, target_id = value, idx
+                break
+        scored.append(
+            {
+                "ids": ids,
+                "scores": scores,
+                "best": scores[0] if scores else 0.0,
+                "target": target,
+                "target_id": target_id,
+            }
+        )
+    return scored
+
+
+# How many documents each query keeps at these thresholds, and for on-topic
+# queries whether the target record is among the first n
+def apply(scored, thresholds, n_results):
+    kept = []
+    hits = 0
+    for query in scored:
+        ids = filter_hits(query["ids"], dict(zip(query["ids"], query["scores"])), **thresholds)[:n_results]
+        kept.append(len(ids))
+        if query["target_id"] is not None:
+            hits += query["target_id"] in ids
+    return {"hits": hits, "mean_kept": round(sum(kept) / len(kept), 3) if kept else 0.0, "empty": kept.count(0)}
+
+
+# Candidate values of one threshold: None (not applied) and `steps` quantiles
+# of the observed values
+def _candidates(values, steps):
+    values = sorted(values)
+    if not values:
+        return [None]
+    return [None, *sorted({round(percentile(values, 100 * i / steps), 4) for i in range(steps + 1)})]
+
+
+# The thresholds that reject the most off-topic queries while the on-topic
+# queries keep their target record in the first n_results at least `keep` as
+# often as without thresholds. Ties go to the higher target recall, then to
+# the fewer thresholds applied.
+def calibrate(on_topic, off_topic, keep, n_results, steps=40):
+    found = [query for query in on_topic if query["target"] is not None]
+    unfiltered = apply(found, {"min_score": None, "margin": None}, n_results)["hits"]
+    min_scores = _candidates([query["target"] for query in found], steps)
+    margins = _candidates([query["best"] - query["target"] for query in found], steps)
+    best_key = None
+    best = {"min_score": None, "margin": None}
+    for min_score in min_scores:
+        for margin in margins:
+            thresholds = {"min_score": min_score, "margin": margin}
+            hits = apply(found, thresholds, n_results)["hits"]
+            if hits < keep * unfiltered:
+                continue
+            rejected = apply(off_topic, thresholds, n_results)["empty"]
+            key = (rejected, hits, -(min_score is not None) - (margin is not None))
+            if best_key is None or key > best_key:
+                best_key, best = key, thresholds
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the retrieval relevance thresholds")
+    parser.add_argument("--path", default=config.KNOWLEDGE_BASE_PATH)
+    parser.add_argument("--paraphrases", default=eval_retrieval.FIXTURE_PATH)
+    parser.add_argument("--off-topic", default=OFF_TOPIC_PATH)
+    parser.add_argument("--backend", choices=["torch", "onnx", "stub"], default=config.EMBEDDING_BACKEND)
+    parser.add_argument(
+        "--keep", type=float, default=0.95, help="share of the unfiltered on-topic target hits to keep"
+    )
+    parser.add_argument("-k", type=int, default=config.N_RESULTS)
+    parser.add_argument("--output", default=config.RELEVANCE_PATH)
+    parser.add_argument("--dry-run", action="store_true", help="only print the thresholds")
+    args = parser.parse_args()
+
+    engine = make_engine(args.path, args.backend)
+    depth = max(args.k, config.HYBRID_CANDIDATES)
+    on_topic = score(engine, on_topic_queries(args.path, args.paraphrases), depth)
+    off_topic = score(engine, [{"text": text} for text in off_topic_queries(args.off_topic)], depth)
+    found = sum(query["target"] is not None for query in on_topic)
+    thresholds = calibrate(on_topic, off_topic, args.keep, args.k)
+
+    targets = sorted(query["target"] for query in on_topic if query["target"] is not None)
+    off_best = sorted(query["best"] for query in off_topic)
+    report = {
+        "on_topic": len(on_topic),
+        "target_in_candidates": found,
+        "off_topic": len(off_topic),
+        "on_topic_target_score": {q: round(percentile(targets, q), 4) for q in (5, 50)},
+        "off_topic_best_score": {q: round(percentile(off_best, q), 4) for q in (50, 95)},
+    }
+    for name, applied in (("unfiltered", {"min_score": None, "margin": None}), ("calibrated", thresholds)):
+        on, off = apply(on_topic, applied, args.k), apply(off_topic, applied, args.k)
+        report[name] = {
+            f"target_recall@{args.k}": round(on["hits"] / found, 3) if found else 0.0,
+            "on_topic_mean_documents": on["mean_kept"],
+            "on_topic_empty": on["empty"],
+            "off_topic_mean_documents": off["mean_kept"],
+            "off_topic_rejected": round(off["empty"] / len(off_topic), 3) if off_topic else 0.0,
+        }
+    print(json.dumps({"embedding": engine.embedding_key, "thresholds": thresholds, **report}, indent=2))
+
+    if not args.dry_run:
+        save_thresholds(
+            engine.embedding_key,
+            {
+                **thresholds,
+                "keep": args.keep,
+                "on_topic_queries": len(on_topic),
+                "off_topic_rejected": report["calibrated"]["off_topic_rejected"],
+                "created": datetime.now(timezone.utc).isoformat(),
+            },
+            args.output,
+        )
+        print(f"Saved thresholds for {engine.embedding_key} to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import config
+from benchmarks.stubs import document_question, stub_engine
+from knowledge_base import load_records
+from utils import git_commit, percentile
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "paraphrases.jsonl")
+
+
+def load_paraphrases(path=FIXTURE_PATH):
+    paraphrases = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    paraphrases[entry["question"]] = entry["paraphrases"]
+    except FileNotFoundError:
+        pass
+    return paraphrases
+
+
+# Every stored question, which should find its own record, and every
+# paraphrase of it from the fixture file
+def build_queries(kb_path, paraphrases):
+    queries = []
+    seen = set()
+    for record in load_records(kb_path):
+        question = record["question"]
+        if question in seen:
+            continue
+        seen.add(question)
+        queries.append({"kind": "question", "text": question, "target": question})
+        for text in paraphrases.get(question, []):
+            queries.append({"kind": "paraphrase", "text": text, "target": question})
+    return queries
+
+
+# "index_mode/retrieval_mode/backend", with backend torch, onnx or stub
+def make_engine(kb_path, spec):
+    index_mode, retrieval_mode, backend = spec.split("/")
+    return stub_engine(
+        kb_path,
+        backend=backend,
+        prefix="eval-index-",
+        retrieval_mode=retrieval_mode,
+        index_mode=index_mode,
+    )
+
+
+# recall@k for every k, MRR over the deepest k, and search latency. The hash
+# index fast path is skipped unless fast_path is set, otherwise every stored
+# question would trivially find itself.
+def evaluate(engine, queries, ks, fast_path=False):
+    depth = max(ks)
+    buckets = {}
+    for query in queries:
+        started = time.perf_counter()
+        if fast_path:
+            documents = engine.query(query["text"], n_results=depth)
+        else:
+            documents = engine.search(query["text"], n_results=depth)
+        latency = 1000 * (time.perf_counter() - started)
+        questions = [document_question(document) for document in documents]
+        rank = questions.index(query["target"]) + 1 if query["target"] in questions else None
+        for kind in ("all", query["kind"]):
+            bucket = buckets.setdefault(kind, {"ranks": [], "latencies": []})
+            bucket["ranks"].append(rank)
+            bucket["latencies"].append(latency)
+
+    report = {}
+    for kind, bucket in buckets.items():
+        ranks = bucket["ranks"]
+        latencies = sorted(bucket["latencies"])
+        report[kind] = {
+            "queries": len(ranks),
+            **{
+                f"recall@{k}": round(sum(r is not None and r <= k for r in ranks) / len(ranks), 3)
+                for k in ks
+            },
+            "mrr": round(sum(1 / r for r in ranks if r) / len(ranks), 3),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+        }
+    return report
+
+
+# Quality and latency regressions against a previous report, for every
+# configuration present in both
+def regressions(report, baseline, max_drop, max_slowdown):
+    previous = {result["config"]: result for result in baseline["results"]}
+    failures = []
+    for result in report["results"]:
+        before = previous.get(result["config"])
+        if before is None:
+            continue
+        current, old = result["all"], before["all"]
+        for metric, value in current.items():
+            if (metric.startswith("recall@") or metric == "mrr") and metric in old:
+                if value < old[metric] - max_drop:
+                    failures.append(f"{result['config']}: {metric} {old[metric]} -> {value}")
+        if old["p95_ms"] and current["p95_ms"] > old["p95_ms"] * (1 + max_slowdown):
+            failures.append(f"{result['config']}: p95 {old['p95_ms']} -> {current['p95_ms']} ms")
+    return failures
+
+
+# Ask the LLM for paraphrases of the stored questions that have none yet
+def generate_paraphrases(kb_path, path, count):
+    from llm_service import LLMService
+
+    llm = LLMService(os.environ["TOGETHER_API_KEY"])
+    paraphrases = load_paraphrases(path)
+    questions = dict.fromkeys(record["question"] for record in load_records(kb_path))
+    try:
+        for question in questions:
+            if paraphrases.get(question):
+                continue
+            answer = llm.complete(
+                [
+                    {
+                        "role": "user",
+                        "content": f"Rewrite this question {count} different ways, keeping its "
+                        f"meaning but changing the wording. One per line, nothing else.\n\n{question}",
+                    }
+                ],
+                {},
+            )
+            lines = [line.strip(" -*0123456789.").strip() for line in answer.splitlines()]
+            paraphrases[question] = [line for line in lines if line][:count]
+    finally:
+        llm.close()
+    with open(path, "w") as f:
+        for question in questions:
+            if paraphrases.get(question):
+                f.write(json.dumps({"question": question, "paraphrases": paraphrases[question]}) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval quality and latency evaluation")
+    parser.add_argument("--path", default=config.KNOWLEDGE_BASE_PATH)
+    parser.add_argument("--paraphrases", default=FIXTURE_PATH)
+    parser.add_argument(
+        "--configs",
+        default=f"{config.INDEX_MODE}/{config.RETRIEVAL_MODE}/{config.EMBEDDING_BACKEND}",
+        help="comma separated index_mode/retrieval_mode/backend, backend torch, onnx or stub",
+    )
+    parser.add_argument("-k", default="1,3,5", help="comma separated cutoffs")
+    parser.add_argument("--fast-path", action="store_true", help="go through the hash index first")
+    parser.add_argument("--output", default="eval_retrieval.json")
+    parser.add_argument("--baseline", help="previous report to gate against")
+    parser.add_argument("--max-drop", type=float, default=0.02, help="allowed recall/MRR drop")
+    parser.add_argument("--max-slowdown", type=float, default=0.5, help="allowed p95 increase, as a fraction")
+    parser.add_argument("--generate", type=int, metavar="N", help="first add N LLM paraphrases per question missing from the fixture")
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_paraphrases(args.path, args.paraphrases, args.generate)
+
+    ks = [int(k) for k in args.k.split(",")]
+    queries = build_queries(args.path, load_paraphrases(args.paraphrases))
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "queries": len(queries),
+        "results": [],
+    }
+    for spec in args.configs.split(","):
+        engine = make_engine(args.path, spec)
+        engine.embed("warm up")
+        result = {"config": spec, **evaluate(engine, queries, ks, args.fast_path)}
+        report["results"].append(result)
+        summary = result["all"]
+        print(
+            f"{spec:<24} "
+            + "  ".join(f"R@{k} {summary[f'recall@{k}']:.3f}" for k in ks)
+            + f"  MRR {summary['mrr']:.3f}  p50 {summary['p50_ms']:.2f} ms  p95 {summary['p95_ms']:.2f} ms"
+        )
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            failures = regressions(report, json.load(f), args.max_drop, args.max_slowdown)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            sys.exit(1)
+        print("No regressions against", args.baseline)
+
+
+if __name__ == "__main__":
+    main()
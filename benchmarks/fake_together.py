@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+# Local stand-in for the Together chat completion endpoint with configurable
+# latency and failure rate. Point TOGETHER_BASE_URL at http://host:port/v1.
+def create_app(latency=0.5, tokens_per_second=50.0, answer_tokens=60, fail_rate=0.0):
+    app = FastAPI()
+    app.state.stats = {"requests": 0, "streams": 0, "failures": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def answer_words(messages):
+        question = next((m["content"] for m in messages if m["role"] == "user"), "")
+        words = f"This is a stubbed answer to: {question}".split()
+        return [(words[i % len(words)] + " ") for i in range(answer_tokens)]
+
+    def usage(messages, words):
+        prompt_tokens = sum(len(m["content"].split()) for m in messages)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words),
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats = app.state.stats
+        stats["requests"] += 1
+        if random.random() < fail_rate:
+            stats["failures"] += 1
+            return JSONResponse({"error": "injected failure"}, status_code=503)
+
+        messages = body["messages"]
+        words = answer_words(messages)
+        created = int(time.time())
+
+        async def tracked(generator):
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            try:
+                async for item in generator:
+                    yield item
+            finally:
+                stats["in_flight"] -= 1
+
+        if body.get("stream"):
+            stats["streams"] += 1
+
+            async def events():
+                await asyncio.sleep(latency)
+                for word in words:
+                    chunk = {
+                        "id": "fake",
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": body["model"],
+                        "choices": [{"index": 0, "delta": {"content": word}}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(1 / tokens_per_second)
+                final = {
+                    "id": "fake",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": body["model"],
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                    "usage": usage(messages, words),
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(tracked(events()), media_type="text/event-stream")
+
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            await asyncio.sleep(latency + len(words) / tokens_per_second)
+        finally:
+            stats["in_flight"] -= 1
+        return {
+            "id": "fake",
+            "object": "chat.completion",
+            "created": created,
+            "model": body["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(words).strip()},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": usage(messages, words),
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return app.state.stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Together chat completion endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.tokens_per_second, args.answer_tokens, args.fail_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import atexit
+import hashlib
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from knowledge_base import tokenize
+from retrieval import RetrievalEngine
+
+
+# Deterministic stand-in for the sentence-transformer: hashed bag of words,
+# normalized, with an optional per-batch and per-text delay to emulate encode
+# cost
+class HashEmbeddingFunction:
+    def __init__(self, dim=384, delay_ms=0.0, item_delay_ms=0.0):
+        self.dim = dim
+        self.delay_ms = delay_ms
+        self.item_delay_ms = item_delay_ms
+
+    def __call__(self, input):
+        delay_ms = self.delay_ms + self.item_delay_ms * len(input)
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        embeddings = []
+        for text in input:
+            vector = np.zeros(self.dim, dtype=np.float32)
+            for token in tokenize(text):
+                digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+                vector[int.from_bytes(digest, "little") % self.dim] += 1.0
+            norm = np.linalg.norm(vector)
+            embeddings.append(vector / norm if norm else vector)
+        return embeddings
+
+
+# Stored question of a "Q: ... A: ..." record document
+def document_question(document):
+    return document[len("Q: ") :].split("\nA: ", 1)[0]
+
+
+# Scratch index directory, removed when the benchmark exits
+def temp_index_dir(prefix="bench-index-"):
+    path = tempfile.mkdtemp(prefix=prefix)
+    atexit.register(shutil.rmtree, path, True)
+    return path
+
+
+# Retrieval engine of a benchmark run, in a scratch index directory unless
+# index_dir is given. The "stub" backend embeds with HashEmbeddingFunction
+# (built with embedding_options) under its own model name, so stub vectors
+# never end up in the real index; any other backend loads the configured
+# model.
+def stub_engine(kb_path, backend="stub", index_dir=None, prefix="bench-index-", embedding_options=None, **options):
+    if backend == "stub":
+        options.update(model_name="stub-hash", embedding_function=HashEmbeddingFunction(**(embedding_options or {})))
+    else:
+        options["embedding_backend"] = backend
+    return RetrievalEngine(kb_path=kb_path, index_dir=index_dir or temp_index_dir(prefix), **options)
@@ -0,0 +1,78 @@
+import config
+from context_builder import estimate_tokens
+from knowledge_base import format_document, record_id
+
+
+# Split a markdown answer into chunks of whole blocks (paragraphs and list
+# items) of at most max_tokens, never across a heading. Every chunk repeats the
+# heading of its section so it still reads on its own, and a lead-in line
+# ending with ":" stays with the list that follows it.
+def chunk_answer(answer, max_tokens=config.CHUNK_MAX_TOKENS):
+    sections = []
+    heading = None
+    blocks = []
+    for line in answer.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#"):
+            if blocks:
+                sections.append((heading, blocks))
+            heading, blocks = line, []
+        else:
+            blocks.append(line)
+    if blocks or not sections:
+        sections.append((heading, blocks))
+
+    chunks = []
+    for heading, blocks in sections:
+        current = []
+        size = 0
+        for block in blocks:
+            tokens = estimate_tokens(block)
+            if current and size + tokens > max_tokens:
+                carry = [current.pop()] if len(current) > 1 and current[-1].endswith(":") else []
+                chunks.append(_chunk(heading, current))
+                current = carry
+                size = sum(estimate_tokens(b) for b in carry)
+            current.append(block)
+            size += tokens
+        if current or heading:
+            chunks.append(_chunk(heading, current))
+    return [chunk for chunk in chunks if chunk]
+
+
+def _chunk(heading, blocks):
+    return "\n".join(([heading] if heading else []) + blocks)
+
+
+# Knowledge base records as chunk records, linked to their parent record by
+# its id and numbered in order so retrieved chunks can be put back together.
+# A chunk's own id covers its parent and position, so editing one section of
+# a record re-indexes all of its chunks.
+def chunk_records(records, model_name, max_tokens=config.CHUNK_MAX_TOKENS):
+    for record in records:
+        parent = record_id(record["question"], record["answer"], model_name)
+        for position, chunk in enumerate(chunk_answer(record["answer"], max_tokens)):
+            yield {
+                "id": record_id(parent, f"{position}\0{chunk}", model_name),
+                "question": record["question"],
+                "answer": chunk,
+                "parent": parent,
+                "chunk": position,
+            }
+
+
+# One Q/A document from chunks of the same record, in their original order,
+# without repeating the heading that consecutive chunks share
+def join_chunks(question, chunks):
+    lines = []
+    heading = None
+    for chunk in sorted(chunks, key=lambda chunk: chunk["chunk"]):
+        first, _, rest = chunk["text"].partition("\n")
+        if first.startswith("#"):
+            if first == heading:
+                first = None
+            heading = first or heading
+        lines.extend(line for line in (first, rest) if line)
+    return format_document(question, "\n".join(lines))
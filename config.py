@@ -0,0 +1,112 @@
+import os
+
+# Knowledge base and index settings
+KNOWLEDGE_BASE_PATH = os.environ.get("KNOWLEDGE_BASE_PATH", "knowledge_base.jsonl")
+COLLECTION_NAME = os.environ.get("COLLECTION_NAME", "knowledge_base")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+INDEX_DIR = os.environ.get("INDEX_DIR", ".index")
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "256"))
+# "record" indexes every Q/A pair as one document, "chunk" splits long answers
+# into heading and list aware chunks of at most CHUNK_MAX_TOKENS
+INDEX_MODE = os.environ.get("INDEX_MODE", "record")
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "64"))
+# "chroma" (HNSW, SQLite) or "numpy" (exact search over a memory-mapped
+# matrix, see vector_store.py)
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "chroma")
+
+# Personas hosted by one process, see tenants.py. Without the TENANTS_PATH
+# file, only the persona in persona.py is served. At most TENANT_MAX_LOADED
+# tenants keep their index in memory; the least recently used is unloaded.
+TENANTS_PATH = os.environ.get("TENANTS_PATH", "tenants.json")
+TENANT_MAX_LOADED = int(os.environ.get("TENANT_MAX_LOADED", "4"))
+
+# Embedding backend: "torch" (sentence-transformers) or "onnx" (int8 export,
+# see embeddings.py)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", os.path.join("models", f"{EMBEDDING_MODEL}-onnx"))
+# 0 lets onnxruntime pick
+ONNX_THREADS = int(os.environ.get("ONNX_THREADS", "0"))
+# Same as the sentence-transformers max_seq_length of all-MiniLM-L6-v2
+EMBEDDING_MAX_LENGTH = int(os.environ.get("EMBEDDING_MAX_LENGTH", "256"))
+
+# Query embedding cache, shared by all sessions. Set EMBEDDING_CACHE_PATH (for
+# example .index/query_embeddings.npz) to keep it across restarts.
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "")
+EMBEDDING_CACHE_SAVE_EVERY = int(os.environ.get("EMBEDDING_CACHE_SAVE_EVERY", "64"))
+
+# Micro-batching of query encodes and vector searches across sessions: wait
+# up to BATCH_WINDOW_MS for more concurrent queries, at most BATCH_MAX_SIZE
+# per batch. 0 runs every query on its own.
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", "2"))
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "32"))
+
+# Retrieval settings
+N_RESULTS = int(os.environ.get("N_RESULTS", "3"))
+# "hybrid" (BM25 + vectors), "dense" or "lexical"
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "hybrid")
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", "10"))
+RRF_K = int(os.environ.get("RRF_K", "60"))
+
+# Relevance thresholds on the cosine similarity of dense hits: drop hits below
+# RELEVANCE_MIN_SCORE or more than RELEVANCE_MARGIN below the best hit. Unset,
+# the values calibrated for the embedding model in RELEVANCE_PATH are used
+# (see benchmarks/calibrate_relevance.py). No calibration ships with the repo,
+# so until one is run (or these are set) every hit is kept and relevance
+# filtering is off.
+RELEVANCE_PATH = os.environ.get("RELEVANCE_PATH", "relevance.json")
+RELEVANCE_MIN_SCORE = os.environ.get("RELEVANCE_MIN_SCORE", "")
+RELEVANCE_MARGIN = os.environ.get("RELEVANCE_MARGIN", "")
+# Reply sent without calling the LLM when no document clears the thresholds.
+# Empty lets the LLM answer without context.
+OFF_TOPIC_REPLY = os.environ.get("OFF_TOPIC_REPLY", "")
+
+# Prompt context settings: token budget for the retrieved documents (0 for no
+# limit) and an optional tokenizer.json of the LLM for exact token counts
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "384"))
+CONTEXT_TOKENIZER_PATH = os.environ.get("CONTEXT_TOKENIZER_PATH", "")
+
+# Conversation memory: recent question/answer pairs sent to the LLM as they
+# are, token cap of the summary of older turns, and messages kept per session
+HISTORY_TURNS = int(os.environ.get("HISTORY_TURNS", "3"))
+HISTORY_SUMMARY_TOKENS = int(os.environ.get("HISTORY_SUMMARY_TOKENS", "200"))
+HISTORY_MAX_MESSAGES = int(os.environ.get("HISTORY_MAX_MESSAGES", "100"))
+# Chat messages rendered per page of the transcript
+RENDER_MESSAGES = int(os.environ.get("RENDER_MESSAGES", "20"))
+
+# Answer cache settings
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "86400"))
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+# Precomputed answers for the category questions
+PRECOMPUTED_PATH = os.environ.get("PRECOMPUTED_PATH", os.path.join(INDEX_DIR, "precomputed.json"))
+WARMUP_ANSWERS = os.environ.get("WARMUP_ANSWERS", "false").lower() == "true"
+
+# LLM settings
+LLM_MODEL = os.environ.get("LLM_MODEL", "meta-llama/Meta-Llama-3-8B-Instruct-Turbo")
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "true").lower() == "true"
+TOGETHER_BASE_URL = os.environ.get("TOGETHER_BASE_URL", "https://api.together.xyz/v1")
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_SECONDS = float(os.environ.get("LLM_BACKOFF_SECONDS", "0.5"))
+
+# Admission control: questions per minute and burst per client (session or
+# IP address, 0 for no limit), and the number of LLM calls allowed to wait for
+# a free LLM_MAX_CONCURRENCY slot before new questions get a retrieval-only
+# answer instead (0 to always wait)
+RATE_LIMIT_PER_MINUTE = float(os.environ.get("RATE_LIMIT_PER_MINUTE", "10"))
+RATE_LIMIT_BURST = int(os.environ.get("RATE_LIMIT_BURST", "5"))
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get("RATE_LIMIT_MAX_CLIENTS", "10000"))
+LLM_MAX_WAITING = int(os.environ.get("LLM_MAX_WAITING", "16"))
+# Proxies in front of the app or API that append to X-Forwarded-For. The
+# client address is the entry the outermost trusted proxy appended; 0 ignores
+# the header.
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "1"))
+
+# Metrics settings
+METRICS_WINDOW = int(os.environ.get("METRICS_WINDOW", "1024"))
+METRICS_LOG = os.environ.get("METRICS_LOG", "false").lower() == "true"
+# The app's metrics panel opens with ?admin=<ADMIN_TOKEN>; empty disables it
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
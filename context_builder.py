@@ -0,0 +1,162 @@
+import math
+import re
+
+import config
+from knowledge_base import STOPWORDS, normalize_question, tokenize
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Shortest tail worth keeping when a span has to be cut to fit the budget
+MIN_TRUNCATED_TOKENS = 12
+
+
+# Rough token count without a tokenizer: words plus punctuation marks, close to
+# what a BPE tokenizer produces for English text
+def estimate_tokens(text):
+    return len(_TOKEN_RE.findall(text))
+
+
+# Token counter for the prompt, exact when a tokenizer.json of the LLM is
+# configured and estimated otherwise
+def make_token_counter(path=config.CONTEXT_TOKENIZER_PATH):
+    if not path:
+        return estimate_tokens
+    from tokenizers import Tokenizer
+
+    tokenizer = Tokenizer.from_file(path)
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def _terms(text):
+    return {token for token in tokenize(text) if token not in STOPWORDS}
+
+
+# Split a "Q: ... A: ..." document into its question and the answer's
+# sentences, keeping the line each sentence came from
+def _spans(document):
+    question, _, answer = document.partition("\nA: ")
+    spans = [(0, question)]
+    for line_no, line in enumerate(answer.splitlines(), start=1):
+        for sentence in _SENTENCE_RE.split(line.strip()):
+            if sentence:
+                spans.append((line_no, sentence))
+    return spans
+
+
+# Retrieved documents turned into prompt context that fits a token budget.
+# Spans repeated across documents (overlapping chunks, near-duplicate records)
+# are kept once. When everything still does not fit, the question of every
+# document is kept and the answer sentences that share the most words with the
+# user question fill the rest, in document rank order on ties; the last span
+# that fits only partly is truncated.
+class ContextBuilder:
+    def __init__(self, budget=config.CONTEXT_TOKEN_BUDGET, count_tokens=None):
+        self.budget = budget
+        self.count_tokens = count_tokens or make_token_counter()
+
+    def build(self, question, documents):
+        documents = list(dict.fromkeys(doc for doc in documents if "A: " in doc))
+        original = "\n".join(documents)
+        original_tokens = self.count_tokens(original)
+
+        units = []
+        seen = set()
+        for rank, document in enumerate(documents):
+            for position, (line_no, text) in enumerate(_spans(document)):
+                key = normalize_question(text)
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                units.append(
+                    {
+                        "rank": rank,
+                        "position": position,
+                        "line": line_no,
+                        "text": text,
+                        "tokens": self.count_tokens(text) + 1,
+                    }
+                )
+
+        if self.budget and sum(unit["tokens"] for unit in units) > self.budget:
+            units = self._select(question, units)
+        text = _assemble(units)
+        tokens = self.count_tokens(text)
+        return {
+            "text": text,
+            "tokens": tokens,
+            "original_tokens": original_tokens,
+            "saved": max(0, original_tokens - tokens),
+        }
+
+    def _select(self, question, units):
+        query = _terms(question)
+
+        def score(unit):
+            terms = _terms(unit["text"])
+            overlap = len(query & terms) / (1 + math.log1p(len(terms)))
+            return overlap + 0.1 / (1 + unit["rank"])
+
+        questions = [unit for unit in units if unit["line"] == 0]
+        answers = sorted(
+            (unit for unit in units if unit["line"] > 0),
+            key=lambda unit: (-score(unit), unit["rank"], unit["position"]),
+        )
+        selected = []
+        remaining = self.budget
+        for unit in questions + answers:
+            if unit["tokens"] <= remaining:
+                selected.append(unit)
+                remaining -= unit["tokens"]
+            elif remaining >= MIN_TRUNCATED_TOKENS:
+                truncated = self._truncate(unit, remaining)
+                if truncated is not None:
+                    selected.append(truncated)
+                remaining = 0
+            if remaining <= 0:
+                break
+        return sorted(selected, key=lambda unit: (unit["rank"], unit["position"]))
+
+    # Longest word prefix of the span that fits in the given tokens, if any
+    def _truncate(self, unit, tokens):
+        words = unit["text"].split()
+        low, high = 0, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(" ".join(words[:middle]) + " ...") + 1 <= tokens:
+                low = middle
+            else:
+                high = middle - 1
+        if low == 0:
+            return None
+        return dict(unit, text=" ".join(words[:low]) + " ...")
+
+
+# Rebuild "Q: ... A: ..." documents from the kept spans: sentences of one line
+# joined by spaces, lines by newlines. Documents left without any answer span
+# are dropped.
+def _assemble(units):
+    documents = []
+    lines = []
+    current_rank = current_line = None
+    for unit in units:
+        if unit["rank"] != current_rank:
+            documents.append(_document(lines))
+            lines = []
+            current_rank, current_line = unit["rank"], None
+        if unit["line"] != current_line:
+            lines.append([unit["line"], unit["text"]])
+            current_line = unit["line"]
+        else:
+            lines[-1][1] += " " + unit["text"]
+    documents.append(_document(lines))
+    return "\n".join(document for document in documents if document)
+
+
+def _document(lines):
+    answer = "\n".join(text for line_no, text in lines if line_no > 0)
+    if not answer:
+        return None
+    if lines[0][0] != 0:
+        return f"A: {answer}"
+    return f"{lines[0][1]}\nA: {answer}"
@@ -0,0 +1,113 @@
+import re
+
+import config
+from context_builder import estimate_tokens
+from knowledge_base import tokenize
+
+SUMMARY_ROLE = "summary"
+
+_MARKDOWN_RE = re.compile(r"[#*_`>|]+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+# Words that point back at an earlier turn, openings that continue one, and
+# questions that are nothing but a reaction to it
+_REFERRING = frozenset(
+    "it its these those they them their he she him his her "
+    "else further elaborate expand above earlier previous again".split()
+)
+_CONTINUING = ("and ", "also ", "but ", "so ", "what about ", "how about ")
+_REACTIONS = frozenset(["why", "why not", "how", "how so", "really", "such as", "like what"])
+
+
+def _gist(text, max_words=30):
+    words = _SENTENCE_RE.split(" ".join(_MARKDOWN_RE.sub(" ", text).split()), 1)[0].split()
+    if len(words) > max_words:
+        return " ".join(words[:max_words]) + " ..."
+    return " ".join(words)
+
+
+# One line per turn: the question and the first sentence of the answer
+def summary_lines(messages):
+    lines = []
+    for message in messages:
+        if message["role"] == "user":
+            lines.append(f"- User: {_gist(message['content'])}")
+        elif message["role"] == "assistant" and lines:
+            lines[-1] += f" / Assistant: {_gist(message['content'])}"
+    return lines
+
+
+# Most recent lines that fit in max_tokens
+def _fit(lines, max_tokens):
+    kept = []
+    tokens = 0
+    for line in reversed(lines):
+        tokens += estimate_tokens(line) + 1
+        if tokens > max_tokens:
+            break
+        kept.append(line)
+    return kept[::-1]
+
+
+def _split(history):
+    summary = []
+    turns = []
+    for message in history:
+        if message["role"] == SUMMARY_ROLE:
+            summary.extend(message["content"].splitlines())
+        elif message["role"] in ("user", "assistant"):
+            turns.append(message)
+    return summary, turns
+
+
+# Whether the question only makes sense against the earlier conversation,
+# like "Why did you leave it?" or "And at Oracle?". Standalone questions are
+# answered the same in any session.
+def refers_back(question):
+    text = " ".join(tokenize(question)) + " "
+    if text.startswith(_CONTINUING) or text.strip() in _REACTIONS:
+        return True
+    return any(token in _REFERRING for token in tokenize(text))
+
+
+# Prompt messages for the earlier conversation: the last window_turns
+# question/answer pairs as they are, and a rolling summary of everything older
+# (including turns already folded into the stored summary), capped at
+# summary_tokens
+def history_messages(
+    history,
+    window_turns=config.HISTORY_TURNS,
+    summary_tokens=config.HISTORY_SUMMARY_TOKENS,
+):
+    summary, turns = _split(history)
+    window = turns[-2 * window_turns :] if window_turns > 0 else []
+    lines = _fit(summary + summary_lines(turns[: len(turns) - len(window)]), summary_tokens)
+    messages = []
+    if lines:
+        messages.append(
+            {
+                "role": "system",
+                "content": "Summary of the earlier conversation:\n" + "\n".join(lines),
+            }
+        )
+    messages.extend({"role": m["role"], "content": m["content"]} for m in window)
+    return messages
+
+
+# Cap the stored transcript in place: the oldest messages beyond max_messages
+# are folded into a single summary entry at the start of the history
+def trim_history(
+    history,
+    max_messages=config.HISTORY_MAX_MESSAGES,
+    summary_tokens=config.HISTORY_SUMMARY_TOKENS,
+):
+    summary, turns = _split(history)
+    excess = len(turns) - max_messages
+    if max_messages <= 0 or excess <= 0:
+        return 0
+    # Fold whole turns so an answer never loses its question
+    if turns[excess]["role"] == "assistant":
+        excess += 1
+    lines = _fit(summary + summary_lines(turns[:excess]), summary_tokens)
+    history[:] = [{"role": SUMMARY_ROLE, "content": "\n".join(lines)}] + turns[excess:]
+    return excess
@@ -0,0 +1,113 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import config
+
+
+# Query text to embedding cache in front of the embedding model, shared by
+# every session through the engine. Vectors are kept as read-only float32
+# arrays and the least recently used entry is evicted once max_entries is
+# reached. With a path, the cache is loaded on startup and written back every
+# save_every new entries, for the same model only.
+class EmbeddingCache:
+    def __init__(
+        self,
+        model_name,
+        max_entries=config.EMBEDDING_CACHE_SIZE,
+        path=config.EMBEDDING_CACHE_PATH,
+        save_every=config.EMBEDDING_CACHE_SAVE_EVERY,
+    ):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.path = path
+        self.save_every = save_every
+
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._unsaved = 0
+        self._counters = {"lookups": 0, "hits": 0, "evictions": 0, "loaded": 0, "saves": 0}
+        if path:
+            self.load()
+
+    def get(self, text):
+        with self._lock:
+            self._counters["lookups"] += 1
+            vector = self._entries.get(text)
+            if vector is None:
+                return None
+            self._entries.move_to_end(text)
+            self._counters["hits"] += 1
+            return vector
+
+    def put(self, text, embedding):
+        if self.max_entries <= 0:
+            return embedding
+        vector = np.array(embedding, dtype=np.float32)
+        vector.setflags(write=False)
+        with self._lock:
+            self._entries[text] = vector
+            self._entries.move_to_end(text)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+            self._unsaved += 1
+            save = self.path and self._unsaved >= self.save_every
+        if save:
+            self.save()
+        return vector
+
+    # Vectors from a cache file written for another model are ignored
+    def load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["model"]) != self.model_name:
+                    return 0
+                texts = data["texts"].tolist()
+                vectors = data["vectors"].astype(np.float32)
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            return 0
+        with self._lock:
+            for text, vector in zip(texts[-self.max_entries :], vectors[-self.max_entries :]):
+                vector.setflags(write=False)
+                self._entries[text] = vector
+            self._counters["loaded"] = len(self._entries)
+        return len(texts)
+
+    # Write the entries, least recently used first, atomically
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            texts = list(self._entries)
+            vectors = list(self._entries.values())
+            self._unsaved = 0
+        if not texts:
+            return
+        with self._save_lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Every server worker saves the same file, each through its own
+            # temporary file
+            tmp_path = f"{self.path}.{os.getpid()}.tmp.npz"
+            np.savez(
+                tmp_path,
+                model=np.array(self.model_name),
+                texts=np.array(texts),
+                vectors=np.stack(vectors),
+            )
+            os.replace(tmp_path, self.path)
+        with self._lock:
+            self._counters["saves"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, entries=len(self._entries))
+            vector_bytes = sum(vector.nbytes for vector in self._entries.values())
+            text_bytes = sum(len(text.encode("utf-8")) for text in self._entries)
+        stats["misses"] = stats["lookups"] - stats["hits"]
+        stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 3) if stats["lookups"] else 0.0
+        stats["memory_kb"] = round((vector_bytes + text_bytes) / 1024, 1)
+        return stats
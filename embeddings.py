@@ -0,0 +1,139 @@
+import argparse
+import os
+import shutil
+
+import numpy as np
+
+import config
+
+BACKENDS = ("torch", "onnx")
+
+# Int8 exports published next to the fp32 one in the sentence-transformers repo
+HUB_VARIANTS = {
+    "fp32": "onnx/model.onnx",
+    "avx2": "onnx/model_quint8_avx2.onnx",
+    "avx512": "onnx/model_qint8_avx512.onnx",
+    "avx512_vnni": "onnx/model_qint8_avx512_vnni.onnx",
+    "arm64": "onnx/model_qint8_arm64.onnx",
+}
+
+
+# Sentence embeddings from an ONNX export of a sentence-transformer: the
+# transformer runs in onnxruntime, followed by the same mean pooling and
+# normalization as the torch model. Only needs onnxruntime and tokenizers, so
+# torch is never imported. Callable like a Chroma embedding function.
+class OnnxEmbeddingFunction:
+    def __init__(
+        self,
+        model_dir=config.ONNX_MODEL_DIR,
+        max_length=config.EMBEDDING_MAX_LENGTH,
+        batch_size=32,
+        threads=config.ONNX_THREADS,
+    ):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, "model.onnx")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"{model_path} not found, export it with `python embeddings.py --model <model> --output-dir {model_dir}`"
+            )
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+
+    def __call__(self, input):
+        embeddings = []
+        for start in range(0, len(input), self.batch_size):
+            encodings = self.tokenizer.encode_batch(input[start : start + self.batch_size])
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": attention_mask,
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            token_embeddings = self.session.run(
+                None, {name: value for name, value in feeds.items() if name in self.input_names}
+            )[0]
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            embeddings.extend(pooled.astype(np.float32))
+        return embeddings
+
+
+# Directory of the ONNX export of a model: ONNX_MODEL_DIR for the configured
+# model, models/<name>-onnx for any other
+def onnx_model_dir(model_name=config.EMBEDDING_MODEL):
+    if model_name == config.EMBEDDING_MODEL:
+        return config.ONNX_MODEL_DIR
+    return os.path.join("models", f"{model_name.replace('/', '--')}-onnx")
+
+
+# Embedding function for the configured backend
+def make_embedding_function(backend=config.EMBEDDING_BACKEND, model_name=config.EMBEDDING_MODEL):
+    if backend == "torch":
+        from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+        return SentenceTransformerEmbeddingFunction(model_name=model_name)
+    if backend == "onnx":
+        return OnnxEmbeddingFunction(onnx_model_dir(model_name))
+    raise ValueError(f"unknown embedding backend: {backend}")
+
+
+# Name the index records are keyed by. Vectors of the two backends are close
+# but not identical, so switching backend re-embeds the knowledge base instead
+# of mixing them in one collection.
+def index_key(model_name, backend=config.EMBEDDING_BACKEND):
+    return model_name if backend == "torch" else f"{model_name}+{backend}"
+
+
+# Download the ONNX export and tokenizer of a sentence-transformers model into
+# output_dir. "quantize" takes the fp32 export and quantizes the weights to int8
+# locally, which needs the onnx package; the other variants are downloaded as is.
+def export_model(model_name, output_dir, variant="avx2"):
+    from huggingface_hub import hf_hub_download
+
+    repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    os.makedirs(output_dir, exist_ok=True)
+    shutil.copyfile(
+        hf_hub_download(repo_id, "tokenizer.json"), os.path.join(output_dir, "tokenizer.json")
+    )
+    target = os.path.join(output_dir, "model.onnx")
+    if variant == "quantize":
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(
+            hf_hub_download(repo_id, HUB_VARIANTS["fp32"]), target, weight_type=QuantType.QInt8
+        )
+    else:
+        shutil.copyfile(hf_hub_download(repo_id, HUB_VARIANTS[variant]), target)
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export an int8 ONNX embedding model")
+    parser.add_argument("--model", default=config.EMBEDDING_MODEL)
+    parser.add_argument("--output-dir", help="models/<model>-onnx by default")
+    parser.add_argument(
+        "--variant",
+        choices=[*HUB_VARIANTS, "quantize"],
+        default="avx2",
+        help="published export to download, or quantize the fp32 export locally",
+    )
+    args = parser.parse_args()
+
+    target = export_model(args.model, args.output_dir or onnx_model_dir(args.model), args.variant)
+    print(f"Saved {target} ({os.path.getsize(target) / 2**20:.1f} MB)")
+    print("Set EMBEDDING_BACKEND=onnx to use it")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import itertools
+import time
+
+import config
+from embeddings import BACKENDS
+from knowledge_base import format_document, record_id
+from utils import peak_rss_mb
+
+
+# Split an iterable into lists of at most size items
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+# Stream records into the collection, embedding and writing them one batch at
+# a time so memory stays flat regardless of corpus size. A record's id is its
+# "id" when it has one (chunk records), otherwise derived from its content.
+# Records whose id is in skip_ids are already indexed and are only counted. Returns the ids seen in
+# the stream along with throughput numbers.
+def ingest(
+    collection,
+    embedding_function,
+    records,
+    model_name,
+    batch_size=config.INGEST_BATCH_SIZE,
+    skip_ids=frozenset(),
+):
+    started = time.perf_counter()
+    seen_ids = set()
+    added = 0
+
+    def pending():
+        for record in records:
+            idx = record.get("id") or record_id(record["question"], record["answer"], model_name)
+            # Identical lines map to the same id, keep the first one
+            if idx in seen_ids:
+                continue
+            seen_ids.add(idx)
+            if idx not in skip_ids:
+                yield idx, record
+
+    for batch in batched(pending(), batch_size):
+        documents = [format_document(r["question"], r["answer"]) for _, r in batch]
+        collection.add(
+            ids=[idx for idx, _ in batch],
+            embeddings=embedding_function(documents),
+            documents=documents,
+            metadatas=[_metadata(r) for _, r in batch],
+        )
+        added += len(batch)
+
+    seconds = time.perf_counter() - started
+    return {
+        "seen_ids": seen_ids,
+        "added": added,
+        "seconds": seconds,
+        "records_per_second": added / seconds if seconds else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# Chunk records also carry their parent record id and position
+def _metadata(record):
+    metadata = {"question": record["question"]}
+    if "parent" in record:
+        metadata.update(parent=record["parent"], chunk=record["chunk"])
+    return metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index a JSONL knowledge base")
+    parser.add_argument("--path", default=config.KNOWLEDGE_BASE_PATH)
+    parser.add_argument("--index-dir", default=config.INDEX_DIR)
+    parser.add_argument("--collection", default=config.COLLECTION_NAME)
+    parser.add_argument("--model", default=config.EMBEDDING_MODEL)
+    parser.add_argument("--backend", choices=BACKENDS, default=config.EMBEDDING_BACKEND)
+    parser.add_argument("--index-mode", choices=["record", "chunk"], default=config.INDEX_MODE)
+    parser.add_argument("--vector-store", choices=["chroma", "numpy"], default=config.VECTOR_STORE)
+    parser.add_argument("--batch-size", type=int, default=config.INGEST_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from retrieval import RetrievalEngine
+
+    engine = RetrievalEngine(
+        kb_path=args.path,
+        model_name=args.model,
+        collection_name=args.collection,
+        index_dir=args.index_dir,
+        batch_size=args.batch_size,
+        embedding_backend=args.backend,
+        index_mode=args.index_mode,
+        vector_store=args.vector_store,
+    )
+    if engine.knowledge_base_missing:
+        parser.error(f"{args.path} not found")
+
+    sync = engine.sync_stats
+    if sync["skipped"]:
+        print(f"{args.path} unchanged, {sync['unchanged']} records already indexed")
+        return
+    print(
+        f"Indexed {args.path}: {sync['added']} added, {sync['removed']} removed, "
+        f"{sync['unchanged']} unchanged in {sync['seconds']:.2f}s "
+        f"({sync['records_per_second']:.1f} records/sec, "
+        f"peak RSS {sync['peak_rss_mb']:.0f} MB)"
+    )
+
+
+if __name__ == "__main__":
+    main()
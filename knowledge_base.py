@@ -0,0 +1,63 @@
+import hashlib
+import json
+import re
+
+# Words that carry no meaning for matching questions against each other
+STOPWORDS = frozenset(
+    "a an and are as at be can could did do does for from have how i in is it "
+    "me my of on or so tell that the to was were what when where which who why "
+    "will with would you your".split()
+)
+
+
+# Read Q/A pairs from a JSONL knowledge base, one record per line
+def load_records(path):
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            yield {
+                "question": data["messages"][0]["content"],
+                "answer": data["messages"][1]["content"],
+            }
+
+
+# Store both question and answer as one document
+def format_document(question, answer):
+    return f"Q: {question}\nA: {answer}"
+
+
+# Stable id for a record: changes whenever its content or the embedding model does
+def record_id(question, answer, model_name):
+    digest = hashlib.sha256()
+    for part in (model_name, question, answer):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+# Hash of the whole knowledge base file, used to skip syncing unchanged files
+def file_fingerprint(path, model_name):
+    digest = hashlib.sha256(model_name.encode("utf-8"))
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Lowercase, drop punctuation and collapse whitespace so trivially different
+# spellings of a question compare equal
+def normalize_question(text):
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+# Lowercased word tokens
+def tokenize(text):
+    return re.findall(r"\w+", text.lower())
+
+
+# Order-independent signature of the meaningful words of a question
+def question_signature(text):
+    return frozenset(token for token in tokenize(text) if token not in STOPWORDS)
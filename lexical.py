@@ -0,0 +1,54 @@
+import math
+from collections import Counter, defaultdict
+
+from knowledge_base import STOPWORDS, tokenize
+
+
+def _terms(text):
+    return [token for token in tokenize(text) if token not in STOPWORDS]
+
+
+# In-process Okapi BM25 index over a list of documents
+class BM25Index:
+    def __init__(self, ids, documents, k1=1.5, b=0.75):
+        self.ids = list(ids)
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(list)
+        self._lengths = []
+        for position, document in enumerate(documents):
+            terms = _terms(document)
+            self._lengths.append(len(terms))
+            for term, count in Counter(terms).items():
+                self._postings[term].append((position, count))
+        self._avg_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+        n = len(self._lengths)
+        self._idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Top k (id, score) pairs for the query, best first
+    def search(self, text, k):
+        scores = defaultdict(float)
+        for term in set(_terms(text)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for position, count in self._postings[term]:
+                norm = 1 - self.b + self.b * self._lengths[position] / self._avg_length
+                scores[position] += idf * count * (self.k1 + 1) / (count + self.k1 * norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.ids[position], score) for position, score in ranked]
+
+
+# Reciprocal-rank fusion of several ranked id lists
+def reciprocal_rank_fusion(rankings, k=60):
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking):
+            scores[idx] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,339 @@
+import asyncio
+import hashlib
+import json
+import queue
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+
+import config
+from metrics import metrics
+
+# Upstream statuses worth retrying: rate limits and transient server errors
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+_END = object()
+
+
+# Output of one upstream streaming call, replayed to every caller that asked
+# the same question while it was in flight
+class _SharedStream:
+    def __init__(self):
+        self.chunks = []
+        self.usage = None
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def push(self, chunk):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def follow(self):
+        position = 0
+        while True:
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+# Chat completion service for the Together API running on its own asyncio loop
+# in a background thread. All calls share one pooled httpx client, at most
+# max_concurrency requests are upstream at once, failed attempts are retried
+# with exponential backoff, and identical requests that arrive while one is in
+# flight wait for that call instead of making their own.
+#
+# complete() and stream() are blocking and meant for Streamlit script threads;
+# complete_async() and stream_async() can be awaited from any other event loop.
+class LLMService:
+    def __init__(
+        self,
+        api_key,
+        base_url=config.TOGETHER_BASE_URL,
+        model=config.LLM_MODEL,
+        max_concurrency=config.LLM_MAX_CONCURRENCY,
+        timeout_seconds=config.LLM_TIMEOUT_SECONDS,
+        max_retries=config.LLM_MAX_RETRIES,
+        backoff_seconds=config.LLM_BACKOFF_SECONDS,
+    ):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0,
+            "upstream_calls": 0,
+            "coalesced": 0,
+            "retries": 0,
+            "failures": 0,
+        }
+        self._in_flight = {}
+        self._streams = {}
+        # Upstream calls holding and waiting for the concurrency gate
+        self._active = 0
+        self._waiting = 0
+        # Callers admitted by admit() that have not released yet
+        self._admitted = 0
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="llm-service", daemon=True
+        )
+        self._thread.start()
+        self._run(self._setup(api_key, base_url)).result()
+
+    async def _setup(self, api_key, base_url):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=self.timeout_seconds,
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+            ),
+        )
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _payload(self, messages, stream):
+        return {"model": self.model, "messages": messages, "stream": stream}
+
+    def _key(self, payload):
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _backoff(self, attempt):
+        return self.backoff_seconds * 2**attempt * random.uniform(0.5, 1.5)
+
+    # The concurrency gate around every upstream call. Only touched on the
+    # service loop; other threads just read the counts.
+    @asynccontextmanager
+    async def _gate(self):
+        started = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        metrics.observe("llm_queue_wait", time.perf_counter() - started)
+        self._active += 1
+        try:
+            self._count("upstream_calls")
+            yield
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+
+    # Upstream calls waiting for a free slot, the queue new requests join
+    def queue_depth(self):
+        return self._waiting
+
+    # Reserve a place for one more call, unless every concurrency slot is
+    # taken and max_waiting callers already queue for them (0 always admits).
+    # Counted from the caller's admission to its release(), including retries
+    # and coalesced calls. Shared by every pipeline using this service.
+    def admit(self, max_waiting):
+        with self._lock:
+            if 0 < max_waiting <= self._admitted - self.max_concurrency:
+                return False
+            self._admitted += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._admitted -= 1
+
+    # One upstream call with retries, bounded by the concurrency gate
+    async def _post(self, payload):
+        for attempt in range(self.max_retries + 1):
+            retryable = attempt < self.max_retries
+            try:
+                async with self._gate():
+                    response = await asyncio.wait_for(
+                        self._client.post("/chat/completions", json=payload),
+                        self.timeout_seconds,
+                    )
+            except (asyncio.TimeoutError, httpx.TimeoutException, httpx.TransportError):
+                if not retryable:
+                    raise
+            else:
+                if not (retryable and response.status_code in RETRY_STATUSES):
+                    response.raise_for_status()
+                    return response.json()
+            self._count("retries")
+            await asyncio.sleep(self._backoff(attempt))
+
+    async def _complete(self, messages):
+        self._count("requests")
+        payload = self._payload(messages, stream=False)
+        key = self._key(payload)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = self._loop.create_task(self._post(payload))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self._count("coalesced")
+        try:
+            # Shielded so a cancelled caller does not cancel the shared call
+            return await asyncio.shield(task)
+        except Exception:
+            self._count("failures")
+            raise
+
+    # Streaming upstream call. Retries are only safe before the first chunk.
+    async def _run_stream(self, shared, payload):
+        try:
+            for attempt in range(self.max_retries + 1):
+                retryable = attempt < self.max_retries
+                try:
+                    async with self._gate():
+                        async with self._client.stream(
+                            "POST", "/chat/completions", json=payload
+                        ) as response:
+                            if retryable and response.status_code in RETRY_STATUSES:
+                                raise _RetryableStatus()
+                            response.raise_for_status()
+                            await self._read_events(shared, response)
+                    shared.finish()
+                    return
+                except (_RetryableStatus, httpx.TimeoutException, httpx.TransportError):
+                    if not retryable or shared.chunks:
+                        raise
+                self._count("retries")
+                await asyncio.sleep(self._backoff(attempt))
+        except Exception as exc:
+            shared.finish(exc)
+
+    async def _read_events(self, shared, response):
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            event = json.loads(data)
+            if event.get("usage"):
+                shared.usage = event["usage"]
+            for choice in event.get("choices") or []:
+                token = (choice.get("delta") or {}).get("content")
+                if token:
+                    shared.push(token)
+
+    def _open_stream(self, messages):
+        self._count("requests")
+        payload = self._payload(messages, stream=True)
+        key = self._key(payload)
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = _SharedStream()
+            self._streams[key] = shared
+            task = self._loop.create_task(self._run_stream(shared, payload))
+            task.add_done_callback(lambda _: self._streams.pop(key, None))
+        else:
+            self._count("coalesced")
+        return shared
+
+    # Feed the chunks of a (possibly shared) stream to emit(), filling in
+    # the timings as they happen
+    async def _pump(self, messages, timings, emit):
+        started = time.perf_counter()
+        timings["ttft_seconds"] = None
+        shared = self._open_stream(messages)
+        try:
+            async for chunk in shared.follow():
+                if timings["ttft_seconds"] is None:
+                    timings["ttft_seconds"] = time.perf_counter() - started
+                emit(chunk)
+            _record_usage(timings, shared.usage)
+        except Exception as exc:
+            self._count("failures")
+            emit(exc)
+        finally:
+            timings["total_seconds"] = time.perf_counter() - started
+            emit(_END)
+
+    async def _timed_complete(self, messages, timings):
+        started = time.perf_counter()
+        response = await self._complete(messages)
+        timings["total_seconds"] = timings["ttft_seconds"] = time.perf_counter() - started
+        _record_usage(timings, response.get("usage"))
+        return response["choices"][0]["message"]["content"]
+
+    # Blocking chat completion
+    def complete(self, messages, timings):
+        return self._run(self._timed_complete(messages, timings)).result()
+
+    # Blocking iterator over the answer chunks as they arrive
+    def stream(self, messages, timings):
+        chunks = queue.Queue()
+        self._run(self._pump(messages, timings, chunks.put))
+        while (item := chunks.get()) is not _END:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    async def complete_async(self, messages, timings):
+        return await asyncio.wrap_future(self._run(self._timed_complete(messages, timings)))
+
+    async def stream_async(self, messages, timings):
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        self._run(
+            self._pump(
+                messages, timings, lambda item: loop.call_soon_threadsafe(chunks.put_nowait, item)
+            )
+        )
+        while (item := await chunks.get()) is not _END:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["in_flight"] = len(self._in_flight) + len(self._streams)
+        stats["max_concurrency"] = self.max_concurrency
+        stats["upstream_active"] = self._active
+        stats["upstream_waiting"] = self._waiting
+        stats["admitted"] = self._admitted
+        return stats
+
+    def close(self):
+        self._run(self._client.aclose()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+class _RetryableStatus(Exception):
+    pass
+
+
+def _record_usage(timings, usage):
+    if usage:
+        timings["prompt_tokens"] = usage.get("prompt_tokens")
+        timings["completion_tokens"] = usage.get("completion_tokens")
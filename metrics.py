@@ -0,0 +1,143 @@
+import json
+import logging
+import threading
+from collections import deque
+
+import config
+from utils import percentile
+
+logger = logging.getLogger("digital_self.metrics")
+# Nothing configures logging under Streamlit or uvicorn, so the request log
+# gets its own handler
+if config.METRICS_LOG and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+# Latency distribution of one stage: running count and sum, plus a window of
+# recent samples for live percentiles
+class Histogram:
+    def __init__(self, window=config.METRICS_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.samples.append(seconds)
+
+    def summary(self):
+        values = sorted(self.samples)
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+
+
+# Process-wide registry of stage timings and counters. Components that keep
+# their own stats (engine, pipeline, cache, LLM service) register them as
+# gauge sources and are read on export.
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._sources = {}
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def register_source(self, name, stats_fn):
+        with self._lock:
+            self._sources[name] = stats_fn
+
+    # Drop a source, unless another stats_fn has been registered under its
+    # name since
+    def unregister_source(self, name, stats_fn):
+        with self._lock:
+            if self._sources.get(name) == stats_fn:
+                del self._sources[name]
+
+    # Stage timings, token counters and everything else about a finished request
+    def record_request(self, stages, timings):
+        for stage, seconds in stages.items():
+            self.observe(stage, seconds)
+        if timings.get("degraded"):
+            self.inc(f"answers_{timings['degraded']}")
+        elif timings.get("cached"):
+            self.inc("answers_cached")
+        else:
+            if timings.get("ttft_seconds") is not None:
+                self.observe("ttft", timings["ttft_seconds"])
+            if timings.get("total_seconds") is not None:
+                self.observe("generation", timings["total_seconds"])
+            self.inc("prompt_tokens", timings.get("prompt_tokens") or 0)
+            self.inc("completion_tokens", timings.get("completion_tokens") or 0)
+            self.inc("context_tokens_saved", timings.get("context_tokens_saved") or 0)
+        self.inc("requests")
+        if config.METRICS_LOG:
+            logger.info(json.dumps({"event": "request", "stages": stages, **timings}))
+
+    def snapshot(self):
+        with self._lock:
+            histograms = {name: h.summary() for name, h in self._histograms.items()}
+            counters = dict(self._counters)
+            sources = dict(self._sources)
+        gauges = {}
+        for source, stats_fn in sources.items():
+            _flatten(stats_fn(), source, gauges)
+        return {"stages": histograms, "counters": counters, "gauges": gauges}
+
+    # Prometheus text exposition format
+    def prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+        for name, summary in sorted(snapshot["stages"].items()):
+            metric = f"digital_self_{_metric_name(name)}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for quantile in ("p50", "p95", "p99"):
+                q = int(quantile[1:]) / 100
+                lines.append(f'{metric}{{quantile="{q}"}} {summary[quantile]:.6f}')
+            lines.append(f"{metric}_count {summary['count']}")
+            lines.append(f"{metric}_sum {summary['sum']:.6f}")
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = f"digital_self_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        for name, value in sorted(snapshot["gauges"].items()):
+            metric = f"digital_self_{_metric_name(name)}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name):
+    return "".join(c if c.isalnum() else "_" for c in name).lower()
+
+
+# Keep the numeric leaves of nested stats, keyed by their joined path
+def _flatten(stats, prefix, out):
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            _flatten(value, name, out)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+
+
+metrics = MetricsRegistry()
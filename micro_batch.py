@@ -0,0 +1,113 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import metrics
+
+
+# Turns single calls from concurrent threads into batched calls. A worker
+# thread takes the first waiting item, keeps collecting for window_ms or until
+# max_batch items are waiting, and runs run_batch once on the whole batch,
+# which returns one result per item in order. Every caller blocks until its
+# own result is ready. in_flight, when given, returns how many callers could
+# submit right now; the window closes early once all of them have, so a lone
+# caller never waits. With window_ms 0 or max_batch 1, submit() calls
+# run_batch directly in the calling thread.
+class MicroBatcher:
+    def __init__(self, name, run_batch, max_batch, window_ms, in_flight=None):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self.in_flight = in_flight
+        self.enabled = window_ms > 0 and max_batch > 1
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._closed = False
+        self._batches = 0
+        self._items = 0
+        self._largest = 0
+
+    def submit(self, item):
+        future = Future()
+        with self._lock:
+            batched = self.enabled and not self._closed
+            if batched:
+                self._ensure_worker()
+                self._queue.put((item, future))
+        if not batched:
+            return self.run_batch([item])[0]
+        return future.result()
+
+    # Called with the lock held
+    def _ensure_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(
+                target=self._run, name=f"{self.name}-batcher", daemon=True
+            )
+            self._worker.start()
+
+    # Stop the worker once the waiting items are done; later calls run
+    # unbatched in the calling thread
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._worker is not None:
+                self._queue.put(None)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        if batch[0] is None:
+            return None
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            if self.in_flight is not None and len(batch) >= self.in_flight():
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            try:
+                results = self.run_batch([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            metrics.observe(f"{self.name}_batch", time.perf_counter() - started)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._largest = max(self._largest, len(batch))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "window_ms": round(1000 * self.window, 3),
+                "max_batch": self.max_batch,
+                "batches": self._batches,
+                "items": self._items,
+                "mean_batch": round(self._items / self._batches, 2) if self._batches else 0.0,
+                "largest_batch": self._largest,
+                "waiting": self._queue.qsize(),
+            }
@@ -0,0 +1,52 @@
+# Title shown above the chat
+DEFAULT_TITLE = "Ravi's Digital Self"
+
+# Default system prompt
+DEFAULT_SYSTEM_PROMPT = """I am Ravi, a Software Engineer with a Master's Degree in Computer Science specializing in Machine Learning. 
+My background includes:
+- Bachelor's in Electronics and Communication Engineering
+- Experience at Oracle and GW Law's Office of Instructional Technology
+- Expertise in Python, JavaScript, cloud technologies, and automation
+- Strong focus on building efficient developer tools and workflows
+
+and You are a digital version of me so try to Answer questions professionally while maintaining a helpful, knowledgeable tone. 
+When possible, provide structured responses with clear sections and bullet points.
+"""
+
+# Replies used instead of a completion when the LLM cannot be called
+RATE_LIMITED_REPLY = "You're sending questions faster than I can answer them. Please try again in {seconds} seconds."
+BUSY_REPLY = "I'm answering a lot of questions right now. Please try again in a moment."
+# Retrieval-only answer while the LLM is saturated, followed by the stored answer
+NOTES_REPLY = "I'm answering a lot of questions right now, so here is what my notes say:\n\n{answer}"
+
+# Categories and questions
+categories = {
+    "Basic": [
+        "What is your educational background?",
+        "How did you get started in software engineering?",
+        "What programming languages do you know?",
+        "What are your strongest technical skills?",
+        "How to contact you?",
+    ],
+    "Work": [
+        "Where are you currently working?",
+        "What companies have you worked for?",
+        "What was your most challenging project?",
+        "What was your Current project?",
+        "What is your leadership experience?",
+    ],
+    "Skills": [
+        "Tell me about your software engineering experience.",
+        "What industries have you worked in?",
+        "What are your most impressive projects?",
+        "Do you have any open source contributions?",
+        "What technologies do you use in your projects?",
+    ],
+    "Hobbies": [
+        "What are your hobbies?",
+        "What do you like to do outside of work?",
+        "What project are you most proud of?",
+        "What are you learning right now?",
+        "Can you share your GitHub?",
+    ],
+}
@@ -0,0 +1,318 @@
+import hashlib
+import math
+import threading
+
+import config
+from admission import RateLimiter
+from answer_cache import AnswerCache
+from context_builder import ContextBuilder
+from conversation import history_messages, refers_back, trim_history
+from knowledge_base import normalize_question
+from metrics import metrics
+from persona import BUSY_REPLY, DEFAULT_SYSTEM_PROMPT, NOTES_REPLY, RATE_LIMITED_REPLY
+from utils import StageTimer
+
+
+# Retrieve-then-generate pipeline used by every entry point. A user message
+# goes through submit() once, which retrieves its context, and the returned
+# request is answered by generate() once, so each message costs exactly one
+# retrieval query and one completion request. Answers are cached, so repeated
+# and near-duplicate questions skip both, and the built-in category questions
+# are served from the precomputed store filled by warmup.py.
+class AnswerPipeline:
+    def __init__(
+        self,
+        engine,
+        llm,
+        system_prompt=DEFAULT_SYSTEM_PROMPT,
+        n_results=config.N_RESULTS,
+        stream=config.STREAM_RESPONSES,
+        cache=None,
+        context_builder=None,
+        off_topic_reply=config.OFF_TOPIC_REPLY,
+        rate_limiter=None,
+        max_llm_waiting=config.LLM_MAX_WAITING,
+        metrics_source="pipeline",
+    ):
+        self.engine = engine
+        self.llm = llm
+        self.system_prompt = system_prompt
+        self.n_results = n_results
+        self.stream = stream
+        self.cache = AnswerCache() if cache is None else cache
+        self.context_builder = context_builder or ContextBuilder()
+        self.off_topic_reply = off_topic_reply
+        self.rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter
+        self.max_llm_waiting = max_llm_waiting
+        self.metrics_source = metrics_source
+        self.precomputed = {"fingerprint": None, "entries": {}}
+
+        self._lock = threading.Lock()
+        self._counters = {
+            "submitted": 0,
+            "precomputed": 0,
+            "retrievals": 0,
+            "completions": 0,
+            "context_tokens": 0,
+            "context_tokens_saved": 0,
+            "no_context": 0,
+            "off_topic_replies": 0,
+            "rate_limited": 0,
+            "overloaded": 0,
+        }
+        metrics.register_source(metrics_source, self.stats)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    # Cached answers are only valid for this knowledge base, prompt and
+    # context budget
+    def cache_fingerprint(self):
+        key = f"{self.engine.kb_fingerprint}\0{self.system_prompt}\0{self.context_builder.budget}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    # Fit the Q/A documents into the context token budget. Returns the context
+    # text with its token count and the tokens saved against the full documents.
+    def build_context(self, question, documents):
+        return self.context_builder.build(question, documents)
+
+    # Retrieve the top matches for the question
+    def retrieve(self, question, embedding=None):
+        self._count("retrievals")
+        documents = self.engine.query(
+            question, n_results=self.n_results, embedding=embedding
+        )
+        return self.build_context(question, documents)
+
+    # Prior turns come from history_messages(): a window of recent turns and a
+    # summary of older ones
+    def build_messages(self, question, context, prior=()):
+        return [
+            {"role": "system", "content": self.system_prompt},
+            *prior,
+            {"role": "user", "content": question},
+            {
+                "role": "system",
+                "content": f"Please use the following information to craft a helpful and accurate response:\n{context}"
+                if context
+                else "No additional information is available. Please provide a concise and professional response.",
+            },
+        ]
+
+    # Add the user message to history and prepare its LLM request, or serve
+    # it from the answer cache. client (a session id or IP address) is rate
+    # limited: only questions that need retrieval or the LLM take from its
+    # bucket, and over its limit only cached answers are served.
+    def submit(self, question, history, client=None):
+        self._count("submitted")
+        prior = history_messages(history)
+        history.append({"role": "user", "content": question})
+        timer = StageTimer()
+        request = {
+            "question": question,
+            "followup": False,
+            "embedding": None,
+            "cached_answer": None,
+            "context": None,
+            "context_tokens": 0,
+            "context_tokens_saved": 0,
+            "messages": None,
+            "answered": False,
+            "degraded": None,
+            "retry_after": 0.0,
+            "stages": timer.stages,
+        }
+
+        self.engine.refresh_if_changed()
+        fingerprint = self.cache_fingerprint()
+        self.cache.check_fingerprint(fingerprint)
+        entry = self._precomputed_entry(question, fingerprint)
+        if entry is not None:
+            self._count("precomputed")
+
+        # Answers to follow-up questions depend on the conversation, so they
+        # skip the answer cache. A question is a follow-up when it refers back
+        # to an earlier turn; precomputed and stored questions stand on their
+        # own whatever the conversation.
+        request["followup"] = bool(prior) and entry is None and refers_back(question)
+        cached = entry.get("answer") if entry is not None else None
+        if cached is None and not request["followup"]:
+            cached = self.cache.get(question)
+        # Precomputed and stored questions already have their context, only
+        # embed the rest
+        known_document = None
+        if cached is None and entry is None:
+            known_document = self.engine.lookup(question)
+            if known_document is not None and request["followup"]:
+                request["followup"] = False
+                cached = self.cache.get(question)
+            elif known_document is None:
+                timer.mark("lookup")
+                request["embedding"] = self.engine.embed(question)
+                timer.mark("embed")
+                if not request["followup"]:
+                    cached = self.cache.get_similar(request["embedding"])
+        timer.mark("lookup")
+        if cached is not None:
+            request["cached_answer"] = cached
+            return request
+        retry_after = self.rate_limiter.check(client)
+        if retry_after:
+            self._count("rate_limited")
+            request["degraded"] = "rate_limited"
+            request["retry_after"] = retry_after
+            request["cached_answer"] = RATE_LIMITED_REPLY.format(seconds=math.ceil(retry_after))
+            return request
+
+        if entry is not None:
+            context = {
+                "text": entry["context"],
+                "tokens": entry.get("context_tokens", 0),
+                "saved": entry.get("context_tokens_saved", 0),
+            }
+        elif known_document is not None:
+            self._count("retrievals")
+            context = self.build_context(question, [known_document])
+        else:
+            context = self.retrieve(question, request["embedding"])
+        request["context"] = context["text"]
+        request["context_tokens"] = context["tokens"]
+        request["context_tokens_saved"] = context["saved"]
+        timer.mark("retrieve")
+        # Nothing in the knowledge base cleared the relevance thresholds. A
+        # follow-up can still be answered from the conversation.
+        if not context["text"]:
+            self._count("no_context")
+            if self.off_topic_reply and not request["followup"]:
+                self._count("off_topic_replies")
+                request["cached_answer"] = self.off_topic_reply
+                return request
+        request["messages"] = self.build_messages(question, request["context"], prior)
+        timer.mark("prompt")
+        return request
+
+    def _precomputed_entry(self, question, fingerprint):
+        store = self.precomputed
+        if store.get("fingerprint") != fingerprint:
+            return None
+        return store["entries"].get(normalize_question(question))
+
+    # Generate the answer to a submitted request: a chunk iterator when
+    # streaming, the full text otherwise. A request can only be answered once.
+    # The LLM admission is only held while the completion runs, so a request
+    # that is never generated (or a stream that is never read) holds nothing.
+    def generate(self, request, timings):
+        if self._claim(request, timings):
+            answer = request["cached_answer"]
+            return iter([answer]) if self.stream else answer
+        if self.stream:
+            return self._stream(request, timings)
+        if not self._admit(request, timings):
+            return request["cached_answer"]
+        try:
+            return self.llm.complete(request["messages"], timings)
+        finally:
+            self.llm.release()
+
+    def _stream(self, request, timings):
+        if not self._admit(request, timings):
+            yield request["cached_answer"]
+            return
+        try:
+            yield from self.llm.stream(request["messages"], timings)
+        finally:
+            self.llm.release()
+
+    # Async counterparts of generate() for callers running an event loop
+    async def complete_async(self, request, timings):
+        if self._claim(request, timings):
+            return request["cached_answer"]
+        if not self._admit(request, timings):
+            return request["cached_answer"]
+        try:
+            return await self.llm.complete_async(request["messages"], timings)
+        finally:
+            self.llm.release()
+
+    async def stream_async(self, request, timings):
+        if self._claim(request, timings) or not self._admit(request, timings):
+            yield request["cached_answer"]
+            return
+        try:
+            async for chunk in self.llm.stream_async(request["messages"], timings):
+                yield chunk
+        finally:
+            self.llm.release()
+
+    # Mark the request as answered; True when it is served from cache
+    def _claim(self, request, timings):
+        if request["answered"]:
+            raise RuntimeError("request was already answered")
+        request["answered"] = True
+        if request["cached_answer"] is not None:
+            self._served_cached(request, timings)
+            return True
+        return False
+
+    def _served_cached(self, request, timings):
+        timings.update(ttft_seconds=0.0, total_seconds=0.0, cached=True)
+        if request["degraded"]:
+            timings["degraded"] = request["degraded"]
+
+    # Take a place in the LLM queue, or when the LLM is saturated (see
+    # LLMService.admit) turn the request into a retrieval-only answer instead.
+    # The caller releases the place once the completion is done.
+    def _admit(self, request, timings):
+        if not self.llm.admit(self.max_llm_waiting):
+            self._count("overloaded")
+            request["degraded"] = "overloaded"
+            answer = retrieval_only_answer(request["context"])
+            request["cached_answer"] = NOTES_REPLY.format(answer=answer) if answer else BUSY_REPLY
+            self._served_cached(request, timings)
+            return False
+        self._count("completions")
+        self._count("context_tokens", request["context_tokens"])
+        self._count("context_tokens_saved", request["context_tokens_saved"])
+        timings.update(
+            context_tokens=request["context_tokens"],
+            context_tokens_saved=request["context_tokens_saved"],
+        )
+        return True
+
+    # Store assistant response, cache freshly generated answers and report
+    # the request's stage timings. The stored history is capped, older turns
+    # are folded into its summary.
+    def record(self, request, history, answer, timings):
+        history.append({"role": "assistant", "content": answer, **timings})
+        trim_history(history)
+        metrics.record_request(request["stages"], timings)
+        if request["cached_answer"] is None and not request["followup"]:
+            self.cache.put(request["question"], answer, request["embedding"])
+
+    # Full non-streaming round trip for callers outside the chat UI
+    def answer(self, question, history=None, client=None):
+        history = [] if history is None else history
+        request = self.submit(question, history, client)
+        timings = {}
+        answer = self.generate(request, timings)
+        if not isinstance(answer, str):
+            answer = "".join(answer)
+        self.record(request, history, answer, timings)
+        return {"answer": answer, "context": request["context"], **timings}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["cache"] = self.cache.stats()
+        stats["llm"] = self.llm.stats()
+        stats["rate_limit"] = self.rate_limiter.stats()
+        return stats
+
+
+# The answer of the best retrieved record in a built context, for replying
+# without the LLM
+def retrieval_only_answer(context):
+    documents = ("\n" + (context or "")).split("\nQ: ")
+    document = next((document for document in documents if document.strip()), "")
+    return ("\n" + document).partition("\nA: ")[2].strip()
@@ -0,0 +1,54 @@
+import json
+import os
+
+import config
+
+
+# Cosine similarity of two unit vectors from their squared L2 distance, the
+# distance both vector stores return. Every embedding backend normalizes.
+def similarity(distance):
+    return 1.0 - distance / 2.0
+
+
+# Thresholds for the engine's embedding model: the calibrated values in path,
+# overridden by RELEVANCE_MIN_SCORE and RELEVANCE_MARGIN. A threshold that is
+# None is not applied.
+def load_thresholds(embedding_key, path=config.RELEVANCE_PATH):
+    thresholds = {"min_score": None, "margin": None}
+    try:
+        with open(path, "r") as f:
+            calibrated = json.load(f).get(embedding_key, {})
+        thresholds.update({name: calibrated.get(name) for name in thresholds})
+    except (FileNotFoundError, ValueError):
+        pass
+    if config.RELEVANCE_MIN_SCORE:
+        thresholds["min_score"] = float(config.RELEVANCE_MIN_SCORE)
+    if config.RELEVANCE_MARGIN:
+        thresholds["margin"] = float(config.RELEVANCE_MARGIN)
+    return thresholds
+
+
+# Ranked ids whose score clears min_score and is within margin of the best
+# score, so a clear winner is returned alone and an off-topic query gets none
+def filter_hits(ids, scores, min_score=None, margin=None):
+    if not ids:
+        return []
+    best = max(scores[idx] for idx in ids)
+    floor = best - margin if margin is not None else float("-inf")
+    if min_score is not None:
+        floor = max(floor, min_score)
+    return [idx for idx in ids if scores[idx] >= floor]
+
+
+# Merge the thresholds calibrated for one embedding model into path
+def save_thresholds(embedding_key, thresholds, path=config.RELEVANCE_PATH):
+    try:
+        with open(path, "r") as f:
+            calibrated = json.load(f)
+    except (FileNotFoundError, ValueError):
+        calibrated = {}
+    calibrated[embedding_key] = thresholds
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(calibrated, f, indent=2)
+    os.replace(tmp_path, path)
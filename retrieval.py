@@ -0,0 +1,610 @@
+import atexit
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+from embedding_cache import EmbeddingCache
+from chunking import chunk_records, join_chunks
+from embeddings import index_key, make_embedding_function
+from ingest import ingest
+from knowledge_base import (
+    file_fingerprint,
+    load_records,
+    normalize_question,
+    question_signature,
+)
+from lexical import BM25Index, reciprocal_rank_fusion
+from metrics import metrics
+from micro_batch import MicroBatcher
+from relevance import filter_hits, load_thresholds, similarity
+from utils import current_rss_mb
+
+# Disable tokenizer parallelism warnings
+os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+# Chunks retrieved per requested record in the chunked index mode
+CHUNKS_PER_RESULT = 3
+
+
+# Key the index records are stored under. Changing the model, the embedding
+# backend or the chunking re-embeds the knowledge base.
+def engine_index_key(embedding_key, index_mode, chunk_tokens):
+    if index_mode == "chunk":
+        return f"{embedding_key}+chunks{chunk_tokens}"
+    if index_mode != "record":
+        raise ValueError(f"unknown index mode: {index_mode}")
+    return embedding_key
+
+
+# Query side of the embedding model: the query embedding cache in front of
+# micro-batched encodes, see MicroBatcher. One encoder can serve several
+# engines over the same model, see tenants.py. Calling it encodes documents
+# under the same model lock.
+class QueryEncoder:
+    def __init__(
+        self,
+        embedding_function,
+        embedding_key,
+        batch_window_ms=config.BATCH_WINDOW_MS,
+        batch_max_size=config.BATCH_MAX_SIZE,
+    ):
+        self.embedding_function = embedding_function
+        self.embedding_key = embedding_key
+        self.cache = EmbeddingCache(embedding_key)
+        if self.cache.path:
+            atexit.register(self.cache.save)
+
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._active = 0
+        self._batcher = MicroBatcher(
+            "encode", self._encode_batch, batch_max_size, batch_window_ms, lambda: self._active
+        )
+
+    # Counts the callers on their way to the batcher, the most a batch can
+    # wait for
+    @contextmanager
+    def activity(self):
+        with self._lock:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    # Embed a single query text, through the query embedding cache. Misses
+    # from concurrent sessions are encoded together.
+    def embed(self, text):
+        embedding = self.cache.get(text)
+        if embedding is not None:
+            return embedding
+        with self.activity():
+            return self.cache.put(text, self._batcher.submit(text))
+
+    def _encode_batch(self, texts):
+        unique = list(dict.fromkeys(texts))
+        embeddings = dict(zip(unique, self(unique)))
+        return [embeddings[text] for text in texts]
+
+    # The embedding model is not safe to share between concurrent encodes
+    def __call__(self, input):
+        with self._model_lock:
+            return self.embedding_function(input)
+
+    def close(self):
+        self._batcher.close()
+
+    def stats(self):
+        return self._batcher.stats()
+
+
+# Retrieval engine holding the embedding model, the vector store client and
+# the knowledge base collection. One instance is shared by every Streamlit
+# session and thread in the process, see get_engine(). An engine builds its
+# own QueryEncoder unless it is given one to share.
+class RetrievalEngine:
+    def __init__(
+        self,
+        kb_path=config.KNOWLEDGE_BASE_PATH,
+        model_name=config.EMBEDDING_MODEL,
+        collection_name=config.COLLECTION_NAME,
+        index_dir=config.INDEX_DIR,
+        batch_size=config.INGEST_BATCH_SIZE,
+        retrieval_mode=config.RETRIEVAL_MODE,
+        embedding_backend=config.EMBEDDING_BACKEND,
+        embedding_function=None,
+        index_mode=config.INDEX_MODE,
+        chunk_tokens=config.CHUNK_MAX_TOKENS,
+        vector_store=config.VECTOR_STORE,
+        batch_window_ms=config.BATCH_WINDOW_MS,
+        batch_max_size=config.BATCH_MAX_SIZE,
+        relevance=None,
+        encoder=None,
+        metrics_source="engine",
+    ):
+        self.kb_path = kb_path
+        self.index_dir = index_dir
+        self.model_name = model_name
+        # A caller supplied embedding function is identified by model_name alone
+        custom = embedding_function is not None or encoder is not None
+        self.embedding_backend = "custom" if custom else embedding_backend
+        if encoder is not None:
+            self.embedding_key = encoder.embedding_key
+        elif embedding_function is not None:
+            self.embedding_key = model_name
+        else:
+            self.embedding_key = index_key(model_name, embedding_backend)
+        self.index_mode = index_mode
+        self.chunk_tokens = chunk_tokens
+        self.index_key = engine_index_key(self.embedding_key, index_mode, chunk_tokens)
+        self.batch_size = batch_size
+        self.retrieval_mode = retrieval_mode
+        self.vector_store = vector_store
+        self.metrics_source = metrics_source
+        # {"min_score", "margin"}, see relevance.load_thresholds()
+        self.relevance = relevance or load_thresholds(self.embedding_key)
+        self.knowledge_base_missing = False
+        self.kb_fingerprint = None
+        self._kb_stat = None
+        self.sync_stats = {"added": 0, "removed": 0, "unchanged": 0, "skipped": False}
+
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._query_count = 0
+        self._query_seconds = 0.0
+        self._sessions = 0
+        self._paths = {"exact": 0, "lexical": 0, "search": 0}
+        self._relevance_counts = {"dropped": 0, "no_match": 0}
+        self._exact_index = {}
+        self._signature_index = {}
+        self._documents = {}
+        self._chunks = {}
+        self._bm25 = BM25Index([], [])
+        self._searches = 0
+        self._searcher = MicroBatcher(
+            "vector_search", self._query_batch, batch_max_size, batch_window_ms,
+            lambda: self._searches,
+        )
+
+        started = time.perf_counter()
+        rss_before = current_rss_mb()
+
+        # Imported here so that importing this module stays cheap, see LazyEngine
+        if vector_store == "numpy":
+            from vector_store import NumpyClient
+
+            self.client = NumpyClient(index_dir)
+        elif vector_store == "chroma":
+            import chromadb
+
+            self.client = chromadb.PersistentClient(path=index_dir)
+        else:
+            raise ValueError(f"unknown vector store: {vector_store}")
+        self._owns_encoder = encoder is None
+        if encoder is None:
+            encoder = QueryEncoder(
+                embedding_function or make_embedding_function(embedding_backend, model_name),
+                self.embedding_key,
+                batch_window_ms,
+                batch_max_size,
+            )
+        self.encoder = encoder
+        self.embedding_function = encoder.embedding_function
+        self.collection = self.client.get_or_create_collection(
+            name=collection_name, embedding_function=self.embedding_function
+        )
+        self._sync_knowledge_base()
+        self._build_lexical_indexes()
+
+        self.build_seconds = time.perf_counter() - started
+        self.build_rss_mb = current_rss_mb() - rss_before
+        metrics.register_source(metrics_source, self.stats)
+
+    # Bring the on-disk index in line with the knowledge base file: records are
+    # keyed by a content hash, so only added or edited lines are embedded and
+    # removed lines are deleted. An unchanged file is detected by its
+    # fingerprint and skips the sync entirely. Server workers share the index
+    # directory, so the sync holds an exclusive file lock.
+    def _sync_knowledge_base(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(os.path.join(self.index_dir, ".sync.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._sync_locked()
+
+    def _sync_locked(self):
+        try:
+            self._kb_stat = _file_stat(self.kb_path)
+            fingerprint = file_fingerprint(self.kb_path, self.index_key)
+        except FileNotFoundError:
+            self._kb_stat = None
+            self.knowledge_base_missing = True
+            return
+        self.knowledge_base_missing = False
+        self.kb_fingerprint = fingerprint
+        metadata = self.collection.metadata or {}
+        if metadata.get("kb_fingerprint") == fingerprint:
+            self.sync_stats["skipped"] = True
+            self.sync_stats["unchanged"] = self.collection.count()
+            return
+
+        existing = set(self.collection.get(include=[])["ids"])
+        records = load_records(self.kb_path)
+        if self.index_mode == "chunk":
+            records = chunk_records(records, self.index_key, self.chunk_tokens)
+        result = ingest(
+            self.collection,
+            self.encoder,
+            records,
+            self.index_key,
+            batch_size=min(self.batch_size, self.client.get_max_batch_size()),
+            skip_ids=existing,
+        )
+        removed = list(existing - result["seen_ids"])
+        if removed:
+            self.collection.delete(ids=removed)
+
+        self.collection.modify(metadata={"kb_fingerprint": fingerprint})
+        self.sync_stats.update(
+            skipped=False,
+            added=result["added"],
+            removed=len(removed),
+            unchanged=len(existing) - len(removed),
+            seconds=result["seconds"],
+            records_per_second=result["records_per_second"],
+            peak_rss_mb=result["peak_rss_mb"],
+        )
+
+    # Count a new browser session attached to the shared engine
+    def register_session(self):
+        with self._lock:
+            self._sessions += 1
+
+    # Re-sync the index when the knowledge base file was edited since the last
+    # sync. Only a stat() call when nothing changed; returns True on re-sync.
+    def refresh_if_changed(self):
+        try:
+            stat = _file_stat(self.kb_path)
+        except FileNotFoundError:
+            stat = None
+        if stat == self._kb_stat:
+            return False
+        with self._sync_lock:
+            if stat == self._kb_stat:
+                return False
+            self._sync_knowledge_base()
+            self._build_lexical_indexes()
+        return True
+
+    # Hash indexes over the stored questions: the normalized text, and the
+    # set of meaningful words so reordered or reworded phrasings still match.
+    # Also the BM25 index over the full documents for hybrid search. In the
+    # chunked mode the hash indexes map to the whole record put back together
+    # from its chunks, and every chunk keeps its parent and position.
+    def _build_lexical_indexes(self):
+        stored = self.collection.get(include=["documents", "metadatas"])
+        chunks = {}
+        parents = {}
+        records = []
+        for idx, document, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+            question = metadata["question"]
+            if "parent" not in metadata:
+                records.append((question, document))
+                continue
+            chunk = {
+                "parent": metadata["parent"],
+                "chunk": metadata["chunk"],
+                "question": question,
+                "text": document[len(f"Q: {question}\nA: ") :],
+            }
+            chunks[idx] = chunk
+            parents.setdefault(chunk["parent"], []).append(chunk)
+        for parent in parents.values():
+            question = parent[0]["question"]
+            records.append((question, join_chunks(question, parent)))
+
+        exact_index = {}
+        signature_index = {}
+        for question, document in records:
+            exact_index.setdefault(normalize_question(question), document)
+            signature = question_signature(question)
+            if signature:
+                signature_index.setdefault(signature, document)
+        self._exact_index = exact_index
+        self._signature_index = signature_index
+        self._chunks = chunks
+        self._documents = dict(zip(stored["ids"], stored["documents"]))
+        self._bm25 = BM25Index(stored["ids"], stored["documents"])
+
+    # Stored Q/A document whose question matches the text, without touching
+    # the embedding model; None when only a semantic search can answer
+    def lookup(self, text):
+        document = self._exact_index.get(normalize_question(text))
+        path = "exact"
+        if document is None:
+            document = self._signature_index.get(question_signature(text))
+            path = "lexical"
+        if document is not None:
+            with self._lock:
+                self._paths[path] += 1
+        return document
+
+    # Counts the callers on their way to the search batcher, the most a batch
+    # can wait for, see MicroBatcher
+    @contextmanager
+    def _searching(self):
+        with self._lock:
+            self._searches += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._searches -= 1
+
+    # Embed a single query text, through the query embedding cache
+    def embed(self, text):
+        return self.encoder.embed(text)
+
+    # One vector store query for a batch of (embedding, k) requests, at the
+    # largest k, cut back to each request's own k
+    def _query_batch(self, requests):
+        results = self.collection.query(
+            query_embeddings=[embedding for embedding, _ in requests],
+            n_results=max(k for _, k in requests),
+            include=["documents", "distances"],
+        )
+        empty = [[] for _ in requests]
+        ids = results["ids"] or empty
+        documents = results["documents"] or empty
+        distances = results["distances"] or empty
+        return [
+            (ids[i][:k], documents[i][:k], [similarity(d) for d in distances[i][:k]])
+            for i, (_, k) in enumerate(requests)
+        ]
+
+    # Top k dense hits as ids, documents and cosine similarities, before any
+    # relevance threshold
+    def dense_hits(self, text, k, embedding=None):
+        with self._searching():
+            if embedding is None:
+                embedding = self.embed(text)
+            started = time.perf_counter()
+            hits = self._searcher.submit((embedding, k))
+            metrics.observe("vector_query", time.perf_counter() - started)
+        return hits
+
+    # Documents of the top n matches. A question that is stored verbatim is
+    # answered from the hash indexes; everything else goes to search().
+    # Pass the query embedding when the caller already has it to skip the encode.
+    def query(self, text, n_results=config.N_RESULTS, embedding=None):
+        started = time.perf_counter()
+        document = self.lookup(text)
+        if document is not None:
+            documents = [document]
+        else:
+            documents = self.search(text, n_results, embedding=embedding)
+        with self._lock:
+            self._query_count += 1
+            self._query_seconds += time.perf_counter() - started
+            if document is None:
+                self._paths["search"] += 1
+        return documents
+
+    # Ranked search without the hash-index fast path. "dense" is the vector
+    # search alone, "lexical" BM25 alone, and "hybrid" fuses the candidates of
+    # both with reciprocal-rank fusion. Dense hits below the relevance
+    # thresholds are dropped, so 0 to n_results documents come back.
+    def search(self, text, n_results=config.N_RESULTS, embedding=None, mode=None):
+        mode = mode or self.retrieval_mode
+        # Chunks are grouped by record afterwards, so rank more of them
+        k = n_results * CHUNKS_PER_RESULT if self.index_mode == "chunk" else n_results
+        if mode == "lexical":
+            return self._results(self._bm25_ids(text, k), n_results)
+
+        candidates = k if mode == "dense" else max(k, config.HYBRID_CANDIDATES)
+        hit_ids, documents, scores = self.dense_hits(text, candidates, embedding)
+        found = dict(zip(hit_ids, documents))
+        dense_ids = filter_hits(hit_ids, dict(zip(hit_ids, scores)), **self.relevance)
+        dropped = set(hit_ids) - set(dense_ids)
+        thresholded = any(value is not None for value in self.relevance.values())
+        with self._lock:
+            self._relevance_counts["dropped"] += len(dropped)
+            self._relevance_counts["no_match"] += thresholded and not dense_ids
+        if mode == "dense":
+            return self._results(dense_ids, n_results, found)
+        if mode != "hybrid":
+            raise ValueError(f"unknown retrieval mode: {mode}")
+        # Without a relevant dense hit the question is off-topic, whatever
+        # words it shares with the knowledge base
+        if thresholded and not dense_ids:
+            return []
+
+        lexical_ids = [idx for idx in self._bm25_ids(text, candidates) if idx not in dropped]
+        fused = reciprocal_rank_fusion([dense_ids, lexical_ids], k=config.RRF_K)
+        return self._results(fused, n_results, found)
+
+    # Documents of the top n ranked ids. In the chunked mode that is up to n
+    # records from the top ranked chunks, each made of those chunks only, in
+    # their original order.
+    def _results(self, ids, n_results, found=None):
+        found = found or {}
+        if self.index_mode != "chunk":
+            documents = (found.get(idx) or self._documents.get(idx) for idx in ids[:n_results])
+            return [document for document in documents if document]
+        groups = {}
+        for idx in ids[: n_results * CHUNKS_PER_RESULT]:
+            chunk = self._chunks.get(idx)
+            if chunk is None:
+                continue
+            if chunk["parent"] not in groups and len(groups) < n_results:
+                groups[chunk["parent"]] = []
+            if chunk["parent"] in groups:
+                groups[chunk["parent"]].append(chunk)
+        return [join_chunks(chunks[0]["question"], chunks) for chunks in groups.values()]
+
+    def _bm25_ids(self, text, k):
+        started = time.perf_counter()
+        ids = [idx for idx, _ in self._bm25.search(text, k)]
+        metrics.observe("bm25_query", time.perf_counter() - started)
+        return ids
+
+    def stats(self):
+        with self._lock:
+            sessions = self._sessions
+            queries = self._query_count
+            query_seconds = self._query_seconds
+            paths = dict(self._paths)
+            relevance_counts = dict(self._relevance_counts)
+        return {
+            "model": self.model_name,
+            "embedding_backend": self.embedding_backend,
+            "retrieval_mode": self.retrieval_mode,
+            "index_mode": self.index_mode,
+            "vector_store": self.vector_store,
+            "records": self.collection.count(),
+            "build_seconds": round(self.build_seconds, 3),
+            "build_rss_mb": round(self.build_rss_mb, 1),
+            "sync": dict(self.sync_stats),
+            "process_rss_mb": round(current_rss_mb(), 1),
+            "sessions": sessions,
+            "queries": queries,
+            "avg_query_ms": round(1000 * query_seconds / queries, 2) if queries else 0.0,
+            "retrieval_paths": paths,
+            "embedding_cache": self.encoder.cache.stats(),
+            "relevance": {**self.relevance, **relevance_counts},
+            "batching": {"encode": self.encoder.stats(), "vector_search": self._searcher.stats()},
+        }
+
+    # Let go of the index so it can be garbage collected once the last caller
+    # drops the engine. Queries still in progress finish unbatched.
+    def close(self):
+        self._searcher.close()
+        if self._owns_encoder:
+            self.encoder.close()
+        metrics.unregister_source(self.metrics_source, self.stats)
+        if self.vector_store == "chroma":
+            _release_chroma(self.client)
+
+
+# Chroma keeps one system per persist directory in a class-level cache, which
+# would keep a closed engine's index in memory. Drop this client's entry; the
+# next client for the directory starts a fresh one.
+def _release_chroma(client):
+    from chromadb.api.shared_system_client import SharedSystemClient
+
+    identifier = getattr(client, "_identifier", None)
+    SharedSystemClient._identifier_to_system.pop(identifier, None)
+
+
+def _file_stat(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+# Process-wide engine, built once on first use
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RetrievalEngine()
+    return _engine
+
+
+# Stand-in for the process-wide engine that builds it on a background thread,
+# so a fresh process can render right away. Until the engine is ready the
+# knowledge base fingerprint comes from the file itself, which is enough to
+# serve precomputed and cached answers; any other use waits for the engine.
+class LazyEngine:
+    def __init__(self, loader=get_engine, kb_path=config.KNOWLEDGE_BASE_PATH):
+        self._engine = None
+        self._loader = loader
+        self._load_lock = threading.Lock()
+        self.kb_path = kb_path
+        try:
+            key = engine_index_key(
+                index_key(config.EMBEDDING_MODEL, config.EMBEDDING_BACKEND),
+                config.INDEX_MODE,
+                config.CHUNK_MAX_TOKENS,
+            )
+            self._fingerprint = file_fingerprint(kb_path, key)
+        except FileNotFoundError:
+            self._fingerprint = None
+        self._started = time.perf_counter()
+        self.load_seconds = None
+        self._closed = False
+        self._pending_sessions = 0
+        self._sessions_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._load, name="engine-load", daemon=True)
+        self._thread.start()
+
+    def _load(self):
+        try:
+            self.get()
+        except Exception:
+            # get() retries in the caller, which then sees the error
+            pass
+
+    def ready(self):
+        return self._engine is not None
+
+    # The engine, waiting for the background load if it is still running
+    def get(self):
+        if self._engine is None:
+            with self._load_lock:
+                if self._engine is None:
+                    engine = self._loader()
+                    self.load_seconds = time.perf_counter() - self._started
+                    metrics.observe("engine_load", self.load_seconds)
+                    with self._sessions_lock:
+                        for _ in range(self._pending_sessions):
+                            engine.register_session()
+                        self._engine = engine
+                        closed = self._closed
+                    if closed:
+                        engine.close()
+        return self._engine
+
+    # Close the engine now, or as soon as its load finishes
+    def close(self):
+        with self._sessions_lock:
+            self._closed = True
+            engine = self._engine
+        if engine is not None:
+            engine.close()
+
+    # Sessions that start while loading are counted once the engine is up
+    def register_session(self):
+        with self._sessions_lock:
+            if self._engine is None:
+                self._pending_sessions += 1
+                return
+        self._engine.register_session()
+
+    @property
+    def kb_fingerprint(self):
+        if self._engine is None:
+            return self._fingerprint
+        return self._engine.kb_fingerprint
+
+    @property
+    def knowledge_base_missing(self):
+        if self._engine is None:
+            return self._fingerprint is None
+        return self._engine.knowledge_base_missing
+
+    # Nothing to refresh before the engine has synced the file
+    def refresh_if_changed(self):
+        if self._engine is None:
+            return False
+        return self._engine.refresh_if_changed()
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
@@ -0,0 +1,155 @@
+import argparse
+import math
+import multiprocessing
+import os
+from contextlib import asynccontextmanager
+from typing import Literal
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from admission import forwarded_client
+from llm_service import LLMService
+from metrics import metrics
+from tenants import TenantRegistry, load_tenants, sync_indexes
+
+
+# Only plain turns are accepted from clients; summaries and system messages
+# are built by the pipeline itself
+class HistoryMessage(BaseModel):
+    role: Literal["user", "assistant"]
+    content: str
+
+
+class AskRequest(BaseModel):
+    question: str
+    history: list[HistoryMessage] = []
+    # Tenant id, the first tenant when unset
+    persona: str | None = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    registry = TenantRegistry(load_tenants(), LLMService(os.environ["TOGETHER_API_KEY"]))
+    # Other personas load on their first request
+    registry.get()
+    app.state.registry = registry
+    yield
+    registry.llm.close()
+
+
+app = FastAPI(title="Digital self", lifespan=lifespan)
+
+
+# Pipeline of the requested persona; loading one touches the disk, so it
+# stays off the event loop
+async def persona_pipeline(persona):
+    try:
+        return await run_in_threadpool(app.state.registry.get, persona)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"unknown persona: {persona}")
+
+
+# A persona whose index is still loading reports "loading" rather than
+# waiting for it
+@app.get("/health")
+async def health(persona: str | None = None):
+    registry = app.state.registry
+    engine = (await persona_pipeline(persona)).engine
+    if engine.knowledge_base_missing:
+        status = "degraded"
+    else:
+        status = "ok" if engine.ready() else "loading"
+    return {
+        "status": status,
+        "records": engine.collection.count() if engine.ready() else None,
+        "personas": list(registry.tenants),
+        "loaded": registry.loaded(),
+        "pid": os.getpid(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return metrics.prometheus()
+
+
+# Rate limit key: the address the trusted proxy saw, else the peer
+def client_address(http_request):
+    forwarded = forwarded_client(http_request.headers.get("x-forwarded-for"))
+    if forwarded:
+        return forwarded
+    return http_request.client.host if http_request.client else None
+
+
+# 429 with the rate limited reply, recorded like any other answer
+async def rate_limited(pipeline, request, history):
+    timings = {}
+    pipeline.record(request, history, await pipeline.complete_async(request, timings), timings)
+    seconds = math.ceil(request["retry_after"])
+    return JSONResponse(
+        {"error": "rate limited", "answer": request["cached_answer"], "retry_after": seconds},
+        status_code=429,
+        headers={"Retry-After": str(seconds)},
+    )
+
+
+@app.post("/ask")
+async def ask(body: AskRequest, http_request: Request):
+    pipeline = await persona_pipeline(body.persona)
+    history = [message.model_dump() for message in body.history]
+    # Retrieval is CPU bound, keep it off the event loop
+    request = await run_in_threadpool(
+        pipeline.submit, body.question, history, client_address(http_request)
+    )
+    if request["degraded"] == "rate_limited":
+        return await rate_limited(pipeline, request, history)
+    timings = {}
+    answer = await pipeline.complete_async(request, timings)
+    pipeline.record(request, history, answer, timings)
+    return {"answer": answer, "timings": timings}
+
+
+@app.post("/ask/stream")
+async def ask_stream(body: AskRequest, http_request: Request):
+    pipeline = await persona_pipeline(body.persona)
+    history = [message.model_dump() for message in body.history]
+    request = await run_in_threadpool(
+        pipeline.submit, body.question, history, client_address(http_request)
+    )
+    if request["degraded"] == "rate_limited":
+        return await rate_limited(pipeline, request, history)
+
+    async def chunks():
+        timings = {}
+        parts = []
+        async for chunk in pipeline.stream_async(request, timings):
+            parts.append(chunk)
+            yield chunk
+        pipeline.record(request, history, "".join(parts), timings)
+
+    return StreamingResponse(chunks(), media_type="text/plain; charset=utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the answer pipeline over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    # Sync the on-disk index of every persona once in a throwaway process
+    # before starting the workers, so they all open the same up-to-date
+    # indexes without embedding
+    builder = multiprocessing.get_context("spawn").Process(target=sync_indexes)
+    builder.start()
+    builder.join()
+
+    uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
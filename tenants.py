@@ -0,0 +1,229 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import config
+from admission import RateLimiter
+from embeddings import index_key, make_embedding_function
+from metrics import metrics
+from persona import DEFAULT_SYSTEM_PROMPT, DEFAULT_TITLE, categories
+
+DEFAULT_TENANT = "default"
+
+_TENANT_ID = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+
+
+# One hosted persona: its prompt, category questions and knowledge base, and
+# where its index and precomputed answers are kept
+class Tenant:
+    def __init__(
+        self,
+        tenant_id,
+        kb_path,
+        title=DEFAULT_TITLE,
+        system_prompt=DEFAULT_SYSTEM_PROMPT,
+        categories=None,
+        collection_name=config.COLLECTION_NAME,
+        index_dir=None,
+        precomputed_path=None,
+    ):
+        if not _TENANT_ID.match(tenant_id):
+            raise ValueError(f"invalid tenant id: {tenant_id!r}")
+        self.id = tenant_id
+        self.kb_path = kb_path
+        self.title = title
+        self.system_prompt = system_prompt
+        self.categories = categories or {}
+        self.collection_name = collection_name
+        # Every tenant needs an index directory of its own, see
+        # RetrievalEngine.close()
+        self.index_dir = index_dir or os.path.join(config.INDEX_DIR, "tenants", tenant_id)
+        self.precomputed_path = precomputed_path or os.path.join(self.index_dir, "precomputed.json")
+
+    # Name of the tenant's stats in the metrics export. The default tenant
+    # keeps the names of a single-persona deployment.
+    def metrics_source(self, name):
+        return name if self.id == DEFAULT_TENANT else f"{name}_{self.id}"
+
+    def questions(self):
+        return [question for questions in self.categories.values() for question in questions]
+
+
+# The persona in persona.py, served alone when there is no tenants file. It
+# keeps the index and precomputed answers of a single-persona deployment.
+def default_tenant():
+    return Tenant(
+        DEFAULT_TENANT,
+        config.KNOWLEDGE_BASE_PATH,
+        categories=categories,
+        index_dir=config.INDEX_DIR,
+        precomputed_path=config.PRECOMPUTED_PATH,
+    )
+
+
+# Tenants by id, in file order, from a JSON object of tenant id to its
+# settings: "kb_path" (required), "title", "system_prompt" or
+# "system_prompt_path", "categories", "collection_name", "index_dir".
+# Without the file, only the default tenant.
+def load_tenants(path=config.TENANTS_PATH):
+    try:
+        with open(path, "r") as f:
+            entries = json.load(f)
+    except FileNotFoundError:
+        tenant = default_tenant()
+        return {tenant.id: tenant}
+    tenants = {}
+    for tenant_id, entry in entries.items():
+        entry = dict(entry)
+        prompt_path = entry.pop("system_prompt_path", None)
+        if prompt_path:
+            with open(prompt_path, "r") as f:
+                entry["system_prompt"] = f.read()
+        tenants[tenant_id] = Tenant(tenant_id, **entry)
+    if not tenants:
+        raise ValueError(f"{path} lists no tenants")
+    return tenants
+
+
+# Every hosted persona in one process. All tenants share one embedding model
+# (with its query cache and encode batcher), the LLM service and the rate
+# limiter; each has its own pipeline, answer cache and index. Pipelines are
+# built on first use, with the index loading in the background like the
+# single-persona app. At most max_loaded are kept, and loading one more
+# unloads the least recently used. An unloaded tenant is loaded again from
+# its on-disk index, which is already in sync, so only its answer cache is
+# lost.
+class TenantRegistry:
+    def __init__(
+        self,
+        tenants,
+        llm,
+        max_loaded=config.TENANT_MAX_LOADED,
+        encoder=None,
+        rate_limiter=None,
+        warm=True,
+        engine_options=None,
+    ):
+        self.tenants = tenants
+        self.default_id = next(iter(tenants))
+        self.llm = llm
+        self.max_loaded = max(1, max_loaded)
+        self.rate_limiter = RateLimiter() if rate_limiter is None else rate_limiter
+        self.warm = warm
+        self.engine_options = engine_options or {}
+
+        self._encoder = encoder
+        self._encoder_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pipelines = OrderedDict()
+        self._counters = {"loads": 0, "evictions": 0}
+        metrics.register_source("tenants", self.stats)
+
+    def tenant(self, tenant_id=None):
+        return self.tenants[tenant_id or self.default_id]
+
+    # The embedding model is loaded once, by the first tenant that needs it
+    def encoder(self):
+        if self._encoder is None:
+            with self._encoder_lock:
+                if self._encoder is None:
+                    from retrieval import QueryEncoder
+
+                    self._encoder = QueryEncoder(
+                        make_embedding_function(config.EMBEDDING_BACKEND, config.EMBEDDING_MODEL),
+                        index_key(config.EMBEDDING_MODEL, config.EMBEDDING_BACKEND),
+                    )
+        return self._encoder
+
+    # Retrieval engine of the tenant on the shared encoder, synced with its
+    # knowledge base
+    def build_engine(self, tenant):
+        from retrieval import RetrievalEngine
+
+        return RetrievalEngine(
+            kb_path=tenant.kb_path,
+            collection_name=tenant.collection_name,
+            index_dir=tenant.index_dir,
+            encoder=self.encoder(),
+            metrics_source=tenant.metrics_source("engine"),
+            **self.engine_options,
+        )
+
+    # Answer pipeline of the tenant, loading it if needed. Raises KeyError
+    # for an unknown tenant.
+    def get(self, tenant_id=None):
+        tenant = self.tenant(tenant_id)
+        with self._lock:
+            pipeline = self._pipelines.get(tenant.id)
+            if pipeline is not None:
+                self._pipelines.move_to_end(tenant.id)
+                return pipeline
+            pipeline = self._pipelines[tenant.id] = self._load(tenant)
+            self._counters["loads"] += 1
+            evicted = []
+            while len(self._pipelines) > self.max_loaded:
+                evicted.append(self._pipelines.popitem(last=False)[1])
+                self._counters["evictions"] += 1
+        for old in evicted:
+            self._unload(old)
+        return pipeline
+
+    def _load(self, tenant):
+        from pipeline import AnswerPipeline
+        from retrieval import LazyEngine
+        from warmup import warm_up
+
+        engine = LazyEngine(loader=lambda: self.build_engine(tenant), kb_path=tenant.kb_path)
+        pipeline = AnswerPipeline(
+            engine,
+            self.llm,
+            system_prompt=tenant.system_prompt,
+            rate_limiter=self.rate_limiter,
+            metrics_source=tenant.metrics_source("pipeline"),
+        )
+        if self.warm:
+            threading.Thread(
+                target=warm_up,
+                args=(pipeline, tenant.questions()),
+                kwargs={"path": tenant.precomputed_path},
+                name=f"warm-up-{tenant.id}",
+                daemon=True,
+            ).start()
+        return pipeline
+
+    # Sessions still holding the pipeline keep working; its index is freed
+    # once they let go
+    def _unload(self, pipeline):
+        metrics.unregister_source(pipeline.metrics_source, pipeline.stats)
+        pipeline.engine.close()
+
+    def loaded(self):
+        with self._lock:
+            return list(self._pipelines)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            pipelines = dict(self._pipelines)
+        stats.update(tenants=len(self.tenants), loaded=len(pipelines), max_loaded=self.max_loaded)
+        stats["per_tenant"] = {
+            tenant_id: {
+                "submitted": pipeline.stats()["submitted"],
+                "records": pipeline.engine.collection.count() if pipeline.engine.ready() else 0,
+            }
+            for tenant_id, pipeline in pipelines.items()
+        }
+        if self._encoder is not None:
+            stats["embedding_cache"] = self._encoder.cache.stats()
+            stats["encode_batching"] = self._encoder.stats()
+        return stats
+
+
+# Sync the index of every tenant, one at a time, so that server workers start
+# on up-to-date indexes without embedding
+def sync_indexes(path=config.TENANTS_PATH):
+    registry = TenantRegistry(load_tenants(path), llm=None, warm=False)
+    for tenant in registry.tenants.values():
+        registry.build_engine(tenant).close()
@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+
+import pytest
+
+from benchmarks.stubs import HashEmbeddingFunction
+from retrieval import RetrievalEngine
+
+QUESTION = "What do you do on weekends?"
+ANSWER = "## Outdoors\n- Hiking in the hills\n- Cycling by the river\n## Indoors\n- Reading novels\n- Cooking curries"
+
+
+def _write(path, records):
+    with open(path, "w") as f:
+        for question, answer in records:
+            messages = [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+            f.write(json.dumps({"messages": messages}) + "\n")
+
+
+@pytest.fixture
+def kb_dir():
+    with tempfile.TemporaryDirectory(prefix="test-chunking-") as directory:
+        yield directory
+
+
+def _engine(kb_dir, kb_path):
+    return RetrievalEngine(
+        kb_path=kb_path,
+        model_name="stub-hash",
+        index_dir=os.path.join(kb_dir, "index"),
+        embedding_function=HashEmbeddingFunction(),
+        index_mode="chunk",
+        chunk_tokens=8,
+        vector_store="numpy",
+        batch_window_ms=0,
+        relevance={"min_score": None, "margin": None},
+    )
+
+
+def test_edited_record_comes_back_whole(kb_dir):
+    kb_path = os.path.join(kb_dir, "kb.jsonl")
+    _write(kb_path, [(QUESTION, ANSWER)])
+    engine = _engine(kb_dir, kb_path)
+    try:
+        edited = ANSWER.replace("Cooking curries", "Baking bread")
+        _write(kb_path, [(QUESTION, edited)])
+        stat = os.stat(kb_path)
+        os.utime(kb_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert engine.refresh_if_changed()
+
+        document = engine.lookup(QUESTION)
+        for text in ["Hiking in the hills", "Reading novels", "Baking bread"]:
+            assert text in document
+        assert "Cooking curries" not in document
+        assert engine.search("hiking cycling reading baking", n_results=1) == [document]
+    finally:
+        engine.close()
+
+
+def test_records_sharing_a_question_and_chunk_keep_it(kb_dir):
+    kb_path = os.path.join(kb_dir, "kb.jsonl")
+    _write(kb_path, [(QUESTION, ANSWER), (QUESTION, ANSWER.replace("Cooking curries", "Baking bread"))])
+    engine = _engine(kb_dir, kb_path)
+    try:
+        documents = engine.search("hiking cycling reading", n_results=2)
+        assert len(documents) == 2
+        for document in documents:
+            assert "Hiking in the hills" in document
+    finally:
+        engine.close()
@@ -0,0 +1,34 @@
+import pytest
+
+from conversation import refers_back
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "Why did you choose computer science?",
+        "Is there a way to contact you?",
+        "What did you do before Oracle?",
+        "Tell me about a project that you are proud of",
+        "What are your hobbies?",
+        "Where do you like to travel?",
+    ],
+)
+def test_standalone_questions(question):
+    assert not refers_back(question)
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "Why did you leave it?",
+        "And at Oracle?",
+        "What about your hobbies?",
+        "Why?",
+        "Can you elaborate?",
+        "How did they take it?",
+        "Tell me more about her",
+    ],
+)
+def test_follow_up_questions(question):
+    assert refers_back(question)
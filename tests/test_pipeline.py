@@ -0,0 +1,127 @@
+import os
+import tempfile
+
+import pytest
+
+from admission import RateLimiter
+from answer_cache import AnswerCache
+from benchmarks.stubs import HashEmbeddingFunction
+from pipeline import AnswerPipeline
+from retrieval import RetrievalEngine
+
+KB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "knowledge_base.jsonl")
+
+
+# Hashing stand-in for the embedding model that counts its encodes
+class CountingEmbeddingFunction(HashEmbeddingFunction):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def __call__(self, input):
+        self.calls += 1
+        return super().__call__(input)
+
+
+# LLM service stand-in that counts completion requests
+class CountingLLM:
+    max_concurrency = 1
+
+    def __init__(self):
+        self.completions = 0
+
+    def admit(self, max_waiting):
+        return True
+
+    def release(self):
+        pass
+
+    def complete(self, messages, timings):
+        self.completions += 1
+        return f"answer {self.completions}"
+
+    def stream(self, messages, timings):
+        self.completions += 1
+        yield "answer "
+        yield str(self.completions)
+
+    def stats(self):
+        return {"completions": self.completions}
+
+
+@pytest.fixture
+def pipeline_factory():
+    with tempfile.TemporaryDirectory(prefix="test-index-") as index_dir:
+        embedding_function = CountingEmbeddingFunction()
+        engine = RetrievalEngine(
+            kb_path=KB_PATH,
+            model_name="stub-hash",
+            index_dir=index_dir,
+            embedding_function=embedding_function,
+            vector_store="numpy",
+            batch_window_ms=0,
+            relevance={"min_score": None, "margin": None},
+        )
+        embedding_function.calls = 0
+
+        def make(stream=False, **options):
+            options.setdefault("cache", AnswerCache(max_entries=0))
+            options.setdefault("rate_limiter", RateLimiter(per_minute=0))
+            pipeline = AnswerPipeline(engine, CountingLLM(), stream=stream, **options)
+            return pipeline, embedding_function
+
+        yield make
+
+
+def _answer(pipeline, question, history):
+    request = pipeline.submit(question, history)
+    timings = {}
+    answer = pipeline.generate(request, timings)
+    if not isinstance(answer, str):
+        answer = "".join(answer)
+    pipeline.record(request, history, answer, timings)
+    return request, answer
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_new_question_costs_one_encode_and_one_completion(pipeline_factory, stream):
+    pipeline, embedding_function = pipeline_factory(stream)
+    history = []
+    for i, question in enumerate(["Which pets do you keep at home?", "Where do you like to travel?"]):
+        _answer(pipeline, question, history)
+        assert embedding_function.calls == i + 1
+        assert pipeline.llm.completions == i + 1
+    assert pipeline.stats()["retrievals"] == 2
+    assert len(history) == 4
+
+
+def test_stored_question_skips_the_encode(pipeline_factory):
+    pipeline, embedding_function = pipeline_factory()
+    _answer(pipeline, "What are your hobbies?", [])
+    assert embedding_function.calls == 0
+    assert pipeline.llm.completions == 1
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_request_is_answered_once(pipeline_factory, stream):
+    pipeline, _ = pipeline_factory(stream)
+    request = pipeline.submit("Which pets do you keep at home?", [])
+    answer = pipeline.generate(request, {})
+    if stream:
+        "".join(answer)
+    with pytest.raises(RuntimeError):
+        pipeline.generate(request, {})
+    assert pipeline.llm.completions == 1
+
+
+def test_cached_answers_do_not_use_up_the_rate_limit(pipeline_factory):
+    pipeline, _ = pipeline_factory(cache=AnswerCache(), rate_limiter=RateLimiter(per_minute=10, burst=5))
+    history = []
+    request = pipeline.submit("Which pets do you keep at home?", history, client="visitor")
+    pipeline.record(request, history, pipeline.generate(request, {}), {})
+    for _ in range(5):
+        request = pipeline.submit("Which pets do you keep at home?", history, client="visitor")
+        assert request["cached_answer"] == "answer 1"
+    request = pipeline.submit("Where do you like to travel?", history, client="visitor")
+    assert request["degraded"] is None
+    assert pipeline.rate_limiter.stats()["allowed"] == 2
@@ -0,0 +1,52 @@
+import math
+import resource
+import subprocess
+import time
+
+
+# Current resident set size of this process in MB
+def current_rss_mb():
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+# Peak resident set size of this process in MB (ru_maxrss is KB on Linux)
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Splits a request into consecutive stages: each mark() charges the time since
+# the previous mark to the named stage
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+        self._last = time.perf_counter()
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.stages[name] = self.stages.get(name, 0.0) + now - self._last
+        self._last = now
+
+
+# Nearest-rank percentile of an already sorted list
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+# Short hash of the checked out commit, for benchmark reports
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+
+# Largest add() the numpy store accepts in one call, like Chroma's limit
+MAX_BATCH_SIZE = 100_000
+
+
+# Minimal stand-in for chromadb.PersistentClient backed by NumpyCollection
+class NumpyClient:
+    def __init__(self, path):
+        self.path = path
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def get_or_create_collection(self, name, embedding_function=None):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = NumpyCollection(os.path.join(self.path, "numpy", name))
+            return self._collections[name]
+
+    def get_max_batch_size(self):
+        return MAX_BATCH_SIZE
+
+
+# Exact vector store for small corpora with the subset of the Chroma
+# collection API the engine uses. Embeddings live in one contiguous float32
+# file that is memory-mapped read-only, so every worker process shares the
+# same pages; ids, documents and metadatas sit in a JSON side table. A query
+# is one matrix-vector product, ranked by the same squared L2 distance Chroma
+# uses. Writes go to an in-memory copy and are saved by modify(), which the
+# engine calls once at the end of every sync.
+class NumpyCollection:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._meta_path = os.path.join(path, "meta.json")
+        self._loaded_stat = None
+        self._dirty = False
+        self._clear()
+        self._reload()
+
+    def _clear(self):
+        self._metadata = {}
+        self._ids = []
+        self._documents = []
+        self._metadatas = []
+        self._positions = {}
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._sq_norms = np.zeros(0, dtype=np.float32)
+
+    # Pick up a save from another process, unless this one has unsaved writes
+    def _reload(self):
+        try:
+            stat = os.stat(self._meta_path)
+        except FileNotFoundError:
+            return
+        stat = (stat.st_mtime_ns, stat.st_size)
+        if stat == self._loaded_stat or self._dirty:
+            return
+        with open(self._meta_path, "r") as f:
+            table = json.load(f)
+        count, dim = table["count"], table["dim"]
+        if count:
+            vectors = np.memmap(
+                os.path.join(self.path, table["vectors"]), dtype=np.float32, mode="r", shape=(count, dim)
+            )
+        else:
+            vectors = np.zeros((0, dim), dtype=np.float32)
+        self._metadata = table["metadata"]
+        self._ids = table["ids"]
+        self._documents = table["documents"]
+        self._metadatas = table["metadatas"]
+        self._positions = {idx: i for i, idx in enumerate(self._ids)}
+        self._vectors = vectors
+        self._sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+        self._loaded_stat = stat
+
+    @property
+    def metadata(self):
+        with self._lock:
+            self._reload()
+            return self._metadata
+
+    def count(self):
+        with self._lock:
+            self._reload()
+            return len(self._ids)
+
+    def get(self, ids=None, include=("documents", "metadatas")):
+        with self._lock:
+            self._reload()
+            positions = (
+                range(len(self._ids))
+                if ids is None
+                else [self._positions[idx] for idx in ids if idx in self._positions]
+            )
+            result = {"ids": [self._ids[i] for i in positions]}
+            if "documents" in include:
+                result["documents"] = [self._documents[i] for i in positions]
+            if "metadatas" in include:
+                result["metadatas"] = [self._metadatas[i] for i in positions]
+            return result
+
+    def add(self, ids, embeddings, documents, metadatas):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            self._reload()
+            if self._vectors.shape[0] == 0:
+                self._vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+            keep = [i for i, idx in enumerate(ids) if idx not in self._positions]
+            for i in keep:
+                self._positions[ids[i]] = len(self._ids)
+                self._ids.append(ids[i])
+                self._documents.append(documents[i])
+                self._metadatas.append(metadatas[i])
+            vectors = vectors[keep]
+            self._vectors = np.concatenate([self._vectors, vectors])
+            self._sq_norms = np.concatenate([self._sq_norms, np.einsum("ij,ij->i", vectors, vectors)])
+            self._dirty = True
+
+    def delete(self, ids):
+        with self._lock:
+            self._reload()
+            drop = {self._positions[idx] for idx in ids if idx in self._positions}
+            if not drop:
+                return
+            keep = [i for i in range(len(self._ids)) if i not in drop]
+            self._ids = [self._ids[i] for i in keep]
+            self._documents = [self._documents[i] for i in keep]
+            self._metadatas = [self._metadatas[i] for i in keep]
+            self._positions = {idx: i for i, idx in enumerate(self._ids)}
+            self._vectors = self._vectors[keep]
+            self._sq_norms = self._sq_norms[keep]
+            self._dirty = True
+
+    def modify(self, metadata=None):
+        with self._lock:
+            if metadata is not None:
+                self._metadata = dict(metadata)
+            self._save()
+
+    # Write a new vector file, then switch the side table to it. Readers that
+    # still map the old file keep a valid view of it until they reload.
+    def _save(self):
+        os.makedirs(self.path, exist_ok=True)
+        previous = None
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r") as f:
+                previous = json.load(f).get("vectors")
+        name = f"vectors-{uuid.uuid4().hex[:12]}.f32"
+        vectors = np.ascontiguousarray(self._vectors, dtype=np.float32)
+        vectors.tofile(os.path.join(self.path, name))
+        table = {
+            "count": len(self._ids),
+            "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            "vectors": name,
+            "metadata": self._metadata,
+            "ids": self._ids,
+            "documents": self._documents,
+            "metadatas": self._metadatas,
+        }
+        tmp_path = f"{self._meta_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(table, f)
+        os.replace(tmp_path, self._meta_path)
+        if previous and previous != name:
+            try:
+                os.remove(os.path.join(self.path, previous))
+            except FileNotFoundError:
+                pass
+        self._dirty = False
+        self._loaded_stat = None
+        self._reload()
+
+    def query(self, query_embeddings, n_results=10, include=("documents",)):
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        with self._lock:
+            vectors, sq_norms = self._vectors, self._sq_norms
+            ids, documents = self._ids, self._documents
+        result = {"ids": [], "distances": []}
+        if "documents" in include:
+            result["documents"] = []
+        n = min(n_results, len(ids))
+        if n == 0:
+            for key in result:
+                result[key] = [[] for _ in queries]
+            return result
+        # ||q - x||^2 = ||q||^2 - 2 q.x + ||x||^2, one product for all queries
+        distances = (queries * queries).sum(axis=1)[:, None] - 2 * queries @ vectors.T + sq_norms
+        top = np.argpartition(distances, n - 1, axis=1)[:, :n]
+        for row, candidates in enumerate(top):
+            order = candidates[np.argsort(distances[row, candidates])]
+            result["ids"].append([ids[i] for i in order])
+            result["distances"].append(distances[row, order].tolist())
+            if "documents" in include:
+                result["documents"].append([documents[i] for i in order])
+        return result
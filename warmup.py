@@ -0,0 +1,106 @@
+import argparse
+import json
+import os
+
+import config
+from knowledge_base import normalize_question
+from persona import categories
+
+
+# Load the precomputed store, or an empty one if it is missing or unreadable
+def load_store(path=config.PRECOMPUTED_PATH):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"fingerprint": None, "entries": {}}
+
+
+# Write the store atomically. Every server worker warms up and saves the same
+# file, each through its own temporary file.
+def save_store(store, path=config.PRECOMPUTED_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(store, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# Every built-in category question
+def category_questions():
+    return [question for questions in categories.values() for question in questions]
+
+
+# Precompute retrieval context (and optionally the generated answer) for the
+# fixed questions, reusing whatever is already stored for the current
+# knowledge base and prompt. The pipeline serves from the store while the
+# missing entries are filled in.
+def warm_up(
+    pipeline,
+    questions=None,
+    answers=config.WARMUP_ANSWERS,
+    path=config.PRECOMPUTED_PATH,
+):
+    questions = category_questions() if questions is None else questions
+    fingerprint = pipeline.cache_fingerprint()
+    store = load_store(path)
+    if store.get("fingerprint") != fingerprint:
+        store = {"fingerprint": fingerprint, "entries": {}}
+    # Serve what is already stored while the rest is computed
+    pipeline.precomputed = store
+
+    changed = False
+    for question in questions:
+        key = normalize_question(question)
+        entry = store["entries"].get(key)
+        if entry is None:
+            context = pipeline.retrieve(question)
+            entry = {
+                "question": question,
+                "context": context["text"],
+                "context_tokens": context["tokens"],
+                "context_tokens_saved": context["saved"],
+            }
+            store["entries"][key] = entry
+            changed = True
+        if answers and "answer" not in entry:
+            messages = pipeline.build_messages(question, entry["context"])
+            entry["answer"] = pipeline.llm.complete(messages, {})
+            changed = True
+
+    if changed:
+        save_store(store, path)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Precompute retrieval results for the category questions"
+    )
+    parser.add_argument("--path", help="precomputed store, the persona's by default")
+    parser.add_argument("--persona", help="tenant id, the first tenant by default")
+    parser.add_argument(
+        "--answers", action="store_true", help="also generate and store answers"
+    )
+    args = parser.parse_args()
+
+    from llm_service import LLMService
+    from tenants import TenantRegistry, load_tenants
+
+    registry = TenantRegistry(
+        load_tenants(), LLMService(os.environ["TOGETHER_API_KEY"]), warm=False
+    )
+    tenant = registry.tenant(args.persona)
+    args.path = args.path or tenant.precomputed_path
+    store = warm_up(
+        registry.get(tenant.id), tenant.questions(), answers=args.answers, path=args.path
+    )
+    answered = sum("answer" in entry for entry in store["entries"].values())
+    print(
+        f"Stored {len(store['entries'])} precomputed questions "
+        f"({answered} with answers) in {args.path}"
+    )
+
+
+if __name__ == "__main__":
+    main()